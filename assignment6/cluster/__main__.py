@@ -22,32 +22,98 @@ def parse():
     argparse is the built-in error checking and help menu.
     """
     parser = argparse.ArgumentParser(prog='cluster',description='Application to cluster a CSV file.')
-    parser.add_argument('file', type=str, nargs='?', help='the data set to process')
-    parser.add_argument('k', type=str, nargs='?', help='initial cluster size')
+    parser.add_argument('file', type=str, nargs='?',
+                        help='the data set to process (with --batch, a directory or glob)')
+    parser.add_argument('k', type=str, nargs='?',
+                        help='initial cluster size (with --batch, a comma-separated list)')
     
     group = parser.add_mutually_exclusive_group()
     group.add_argument('-v','--view',  action='store_true',  help='visualize clustering on a 2d dataset')
     group.add_argument('-t','--test',  action='store_true',  help='run a unit test on the cluster algorithm')
     group.add_argument('-g','--grade', action='store_true',  help='grade the assignment')
     group.add_argument('-o','--output', type=str,  help='output csv file')
+    group.add_argument('-b','--batch', type=str,
+                       help='cluster every matching file for every k into this directory')
+    parser.add_argument('-m','--minibatch', type=int, help='use mini-batch k-means with this batch size')
+    parser.add_argument('-i','--init', choices=['random','k-means++','k-means||'], default='random',
+                        help='how to choose the initial centroids')
+    parser.add_argument('-e','--engine', choices=['lloyd','hamerly','kdtree'], default='lloyd',
+                        help='how to find the nearest centroids')
+    parser.add_argument('-w','--workers', type=int, default=1, help='number of threads for partitioning')
+    parser.add_argument('-r','--restarts', type=int, default=1,
+                        help='number of runs (in parallel processes) to keep the best of')
+    parser.add_argument('-T','--tolerance', type=float,
+                        help='stop once no centroid moves farther than this')
+    parser.add_argument('-p','--profile', type=str,
+                        help='write per-step profiling events to this file (JSON lines)')
+    parser.add_argument('-d','--metric', default='euclidean',
+                        choices=['euclidean','sqeuclidean','manhattan','cosine','mahalanobis'],
+                        help='the distance measure')
+    parser.add_argument('-c','--coreset', type=int,
+                        help='cluster a weighted summary of this many points instead')
+    parser.add_argument('-j','--jobs', type=int,
+                        help='number of processes for --batch (default: one per CPU)')
+    parser.add_argument('-P','--precision', choices=['float64','float32'], default='float64',
+                        help='the float type of the points (float32 halves their memory)')
     result = parser.parse_args()
 
     if not result.view and not result.test and not result.grade:
         if not result.file:
             parser.error('file is required when no flags are set.')
 
-    if not result.k is None:
+    if not result.minibatch is None and result.minibatch <= 0:
+        parser.error('the mini-batch size must be an int > 0.')
+
+    if result.workers <= 0:
+        parser.error('the number of workers must be an int > 0.')
+
+    if result.engine != 'lloyd' and not result.metric in ('euclidean','sqeuclidean'):
+        parser.error('the %s engine only supports the euclidean metrics.' % result.engine)
+
+    if not result.minibatch is None and result.metric in ('manhattan','cosine'):
+        parser.error('mini-batch k-means does not support the %s metric.' % result.metric)
+
+    if result.restarts <= 0:
+        parser.error('the number of restarts must be an int > 0.')
+
+    if not result.tolerance is None and result.tolerance < 0:
+        parser.error('the tolerance must be a number >= 0.')
+
+    if not result.coreset is None and result.coreset <= 0:
+        parser.error('the coreset size must be an int > 0.')
+
+    if not result.jobs is None and result.jobs <= 0:
+        parser.error('the number of jobs must be an int > 0.')
+
+    if result.batch:
+        if not result.file:
+            parser.error('file is required with --batch.')
+        if result.profile:
+            parser.error('profiling is not supported with --batch.')
+        try:
+            result.k = [int(x) for x in (result.k or '3').split(',')]
+            assert min(result.k) > 0
+        except:
+            parser.error('k must be a comma-separated list of ints > 0.')
+    elif not result.k is None:
         try:
             kval = result.k
             kval = int(kval)
             assert kval > 0
         except:
             parser.error('k must be an int > 0.')
+
+    if not result.coreset is None and not result.k is None:
+        kmax = max(result.k) if result.batch else int(result.k)
+        if result.coreset < kmax:
+            parser.error('the coreset size must be at least k.')
     
     return result
 
 
-def get_clusters(filename,k,output):
+def get_clusters(filename,k,output,minibatch=None,init='random',engine='lloyd',workers=1,
+                 restarts=1,tolerance=None,profile=None,coreset=None,metric='euclidean',
+                 precision='float64'):
     """
     Computes clusters on the given data set
 
@@ -59,9 +125,42 @@ def get_clusters(filename,k,output):
     
     Parameter output: The output file
     Precondition: output is a string or None
+
+    Parameter minibatch: The mini-batch size
+    Precondition: minibatch is an int > 0 or None
+
+    Parameter init: The seeding strategy
+    Precondition: init is 'random', 'k-means++' or 'k-means||'
+
+    Parameter engine: The partitioning engine
+    Precondition: engine is 'lloyd', 'hamerly' or 'kdtree'
+
+    Parameter workers: The number of threads for partitioning
+    Precondition: workers is an int > 0
+
+    Parameter restarts: The number of runs to keep the best of
+    Precondition: restarts is an int > 0
+
+    Parameter tolerance: The centroid shift tolerance
+    Precondition: tolerance is a number >= 0 or None
+
+    Parameter profile: The file for profiling events
+    Precondition: profile is a string or None
+
+    Parameter coreset: The size of the summary to cluster
+    Precondition: coreset is an int >= k or None
+
+    Parameter metric: The distance measure
+    Precondition: metric is 'euclidean', 'sqeuclidean', 'manhattan', 'cosine' or
+    'mahalanobis'
+
+    Parameter precision: The float type of the points
+    Precondition: precision is 'float64' or 'float32'
     """
     from tools import compute
-    table = compute(filename,k)
+    table = compute(filename,k,minibatch=minibatch,init=init,engine=engine,workers=workers,
+                    restarts=restarts,tolerance=tolerance,profile=profile,coreset=coreset,
+                    metric=metric,precision=precision)
     
     if output:
         if not os.path.splitext(output)[1]:
@@ -73,6 +172,39 @@ def get_clusters(filename,k,output):
             print(str(row[0])+'\t'+'\t'.join(map(lambda x: '%.4f' % x,row[1:])))
 
 
+def run_batch(source,kvalues,outdir,processes=None,**options):
+    """
+    Clusters every CSV file of source for each k, writing the results to outdir
+    
+    This prints one line per job, with the file, k, number of points, inertia and the
+    output file (or the error).  See tools.batch for the options.
+    
+    Parameter source: The directory or glob pattern of the files
+    Precondition: source is a string
+    
+    Parameter kvalues: The numbers of clusters
+    Precondition: kvalues is a non-empty list of ints > 0
+    
+    Parameter outdir: The directory for the results
+    Precondition: outdir is a string
+    
+    Parameter processes: The number of worker processes
+    Precondition: processes is None (one per CPU) or an int > 0
+    """
+    from tools import batch, find_csv
+    files = find_csv(source)
+    if not files:
+        print('No CSV files match '+repr(source))
+        return
+    print('FILE\tK\tPOINTS\tINERTIA\tOUTPUT')
+    for job in batch(files,kvalues,outdir,processes,**options):
+        if 'error' in job:
+            print('%s\t%d\t-\t-\tERROR: %s' % (job['file'],job['k'],job['error']))
+        else:
+            print('%s\t%d\t%d\t%.4f\t%s' % (job['file'],job['k'],job['points'],
+                                             job['inertia'],job['output']))
+
+
 def launch_gui(filename,k):
     """
     Launches the gui application with the given dataset (if specified)
@@ -128,9 +260,17 @@ def execute():
         grade(file)
     elif args.view:
         launch_gui(filename,kval)
+    elif args.batch:
+        run_batch(filename,args.k,args.batch,args.jobs,minibatch=args.minibatch,
+                  init=args.init,engine=args.engine,workers=args.workers,
+                  restarts=args.restarts,tolerance=args.tolerance,coreset=args.coreset,
+                  metric=args.metric,precision=args.precision)
     else:
-        get_clusters(filename,kval,args.output)
+        get_clusters(filename,kval,args.output,args.minibatch,args.init,args.engine,
+                     args.workers,args.restarts,args.tolerance,args.profile,args.coreset,
+                     args.metric,args.precision)
 
 
-# Do it
-execute()
+# Do it (but not in the worker processes that import this module)
+if __name__ == '__main__':
+    execute()
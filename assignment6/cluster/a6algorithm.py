@@ -9,14 +9,678 @@ Tianli Xia
 October 28th, 2018
 """
 import math
+import os
 import random
+import time
 import numpy
+import concurrent.futures
 
 
 # For accessing the previous parts of the assignment
 import a6checks
 import a6dataset
 import a6cluster
+import a6metric
+
+
+# The number of floats the assignment step may allocate for one block of distances
+BLOCK_BUDGET = 1 << 20
+
+
+def nearest_labels(points, centroids, metric=None):
+    """
+    Returns an array with the position of the nearest centroid for each point.
+
+    The distances are computed for many points at once with numpy, a block of rows
+    at a time so that the temporary n x k x d array never exceeds BLOCK_BUDGET floats.
+    Only the squared distances are compared, as the square root does not change which
+    centroid is nearest.
+
+    Ties are broken in favor of centroids occurring earlier in centroids.
+
+    If a metric is given, the centroid of least cost for that metric is nearest.
+
+    Parameter points: The points to label
+    Precondition: points is a 2d numpy array of numbers
+
+    Parameter centroids: The centroids to compare against
+    Precondition: centroids is a non-empty 2d numpy array with the same number of
+    columns as points
+
+    Parameter metric: The distance measure (OPTIONAL)
+    Precondition: metric is None (euclidean) or an a6metric.Metric
+    """
+    return nearest_centroids(points, centroids, metric)[0]
+
+
+def nearest_centroids(points, centroids, metric=None):
+    """
+    Returns a pair (labels, dists) for the nearest centroid of each point.
+
+    labels[i] is the position of the centroid nearest to points[i], as computed by
+    nearest_labels, and dists[i] is the SQUARED distance to that centroid (or its cost,
+    if a metric is given).
+
+    Parameter points: The points to label
+    Precondition: points is a 2d numpy array of numbers
+
+    Parameter centroids: The centroids to compare against
+    Precondition: centroids is a non-empty 2d numpy array with the same number of
+    columns as points
+
+    Parameter metric: The distance measure (OPTIONAL)
+    Precondition: metric is None (euclidean) or an a6metric.Metric
+    """
+    size = len(points)
+    labels = numpy.zeros(size, dtype=int)
+    dists  = numpy.zeros(size)
+    rows = block_rows(centroids)
+    for start in range(0, size, rows):
+        block = points[start:start+rows]
+        if metric is None:
+            diff = square_distances(block, centroids)
+        else:
+            diff = metric.cost(block, centroids)
+        # argmin returns the first minimum, which is the tie-breaking rule we want
+        best  = numpy.argmin(diff, axis=1)
+        labels[start:start+rows] = best
+        dists[start:start+rows]  = diff[numpy.arange(len(best)), best]
+    return (labels, dists)
+
+
+def shard_sums(points, centroids, weights=None, metric=None):
+    """
+    Returns a triple (labels, sums, inertia) for the nearest centroids of points.
+
+    labels is nearest_labels(points, centroids), and sums is a numpy array the shape
+    of centroids, where sums[i] is the sum of the points whose nearest centroid is i.
+    inertia is the sum of the squared distances from the points to their nearest
+    centroids, as a float.  If weights are given, each point counts weight times in
+    both sums.  If a metric is given, the points are labeled by (and the inertia is the
+    sum of) the cost of that metric.
+
+    The points are read once, a block of rows at a time, so this works well on a
+    numpy.memmap that does not fit in memory.
+
+    Parameter points: The points to label
+    Precondition: points is a 2d numpy array of numbers
+
+    Parameter centroids: The centroids to compare against
+    Precondition: centroids is a non-empty 2d numpy array with the same number of
+    columns as points
+
+    Parameter weights: The weight of each point (OPTIONAL)
+    Precondition: weights is None or a 1d numpy array of numbers >= 0, one per point
+
+    Parameter metric: The distance measure (OPTIONAL)
+    Precondition: metric is None (euclidean) or an a6metric.Metric
+    """
+    labels = numpy.zeros(len(points), dtype=int)
+    sums = numpy.zeros(centroids.shape)
+    inertia = 0.0
+    rows = block_rows(centroids)
+    for start in range(0, len(points), rows):
+        block = points[start:start+rows]
+        part  = None if weights is None else weights[start:start+rows]
+        best, dists = nearest_centroids(block, centroids, metric)
+        labels[start:start+rows] = best
+        sums += label_sums(block, best, len(centroids), part)
+        inertia += float(dists.sum() if part is None else (dists*part).sum())
+    return (labels, sums, inertia)
+
+
+def label_inertia(points, centroids, labels, weights=None, metric=None):
+    """
+    Returns the sum of the squared distances from points to their labeled centroids.
+
+    If weights are given, each squared distance is multiplied by the weight of its point.
+    If a metric is given, the squared distance is replaced by the cost of the metric.
+    Points with a negative label belong to no centroid, and are skipped.
+
+    The points are read a block of rows at a time, so this works well on a numpy.memmap
+    that does not fit in memory.
+
+    Parameter points: The points to measure
+    Precondition: points is a 2d numpy array of numbers
+
+    Parameter centroids: The centroids to measure against
+    Precondition: centroids is a non-empty 2d numpy array with the same number of
+    columns as points
+
+    Parameter labels: The label of each point
+    Precondition: labels is a 1d numpy array of positions in centroids (or negative
+    ints), one per point
+
+    Parameter weights: The weight of each point (OPTIONAL)
+    Precondition: weights is None or a 1d numpy array of numbers >= 0, one per point
+
+    Parameter metric: The distance measure (OPTIONAL)
+    Precondition: metric is None (euclidean) or an a6metric.Metric
+    """
+    total = 0.0
+    rows = max(1, BLOCK_BUDGET // max(1, points.shape[1]))
+    for start in range(0, len(points), rows):
+        block = points[start:start+rows]
+        part  = labels[start:start+rows]
+        scale = None if weights is None else weights[start:start+rows]
+        if (part < 0).any():
+            keep  = part >= 0
+            block = block[keep]
+            part  = part[keep]
+            scale = None if scale is None else scale[keep]
+        if metric is None:
+            diff = block-centroids[part]
+            dists = (diff*diff).sum(axis=1)
+        else:
+            dists = numpy.zeros(len(part))
+            for pos in numpy.unique(part):
+                mask = part == pos
+                dists[mask] = metric.cost(block[mask], centroids[pos:pos+1])[:, 0]
+        if scale is not None:
+            dists = dists*scale
+        total += float(dists.sum())
+    return total
+
+
+def label_sums(points, labels, count, weights=None):
+    """
+    Returns a count x d numpy array where row i is the sum of the points labeled i.
+
+    If weights are given, each point is multiplied by its weight in the sum.
+
+    The points are read a block of rows at a time, so this works well on a numpy.memmap
+    that does not fit in memory.
+
+    Parameter points: The points to sum
+    Precondition: points is a 2d numpy array of numbers
+
+    Parameter labels: The label of each point
+    Precondition: labels is a 1d numpy array of ints in 0..count-1, one per point
+
+    Parameter count: The number of labels
+    Precondition: count is an int > 0
+
+    Parameter weights: The weight of each point (OPTIONAL)
+    Precondition: weights is None or a 1d numpy array of numbers >= 0, one per point
+    """
+    sums = numpy.zeros((count, points.shape[1]))
+    rows = max(1, BLOCK_BUDGET // max(1, points.shape[1]))
+    for start in range(0, len(points), rows):
+        block = points[start:start+rows]
+        part  = labels[start:start+rows]
+        scale = None if weights is None else weights[start:start+rows]
+        for col in range(points.shape[1]):
+            values = block[:, col] if scale is None else block[:, col]*scale
+            sums[:, col] += numpy.bincount(part, weights=values, minlength=count)
+    return sums
+
+
+def block_rows(centroids):
+    """
+    Returns the number of points to compare against centroids at once.
+
+    This is the number of rows that keeps the temporary n x k x d array of a call to
+    square_distances within BLOCK_BUDGET floats.
+
+    Parameter centroids: The centroids to compare against
+    Precondition: centroids is a non-empty 2d numpy array
+    """
+    return max(1, BLOCK_BUDGET // max(1, centroids.size))
+
+
+def square_distances(points, centroids):
+    """
+    Returns the n x k numpy array of squared distances from points to centroids.
+
+    Every engine computes distances with this function (which is the kernel of the
+    euclidean metrics in a6metric), so that they all agree on which centroid is
+    nearest, down to the last bit.
+
+    Parameter points: The points to measure
+    Precondition: points is a 2d numpy array of numbers, with at most block_rows
+    (centroids) rows to respect the memory budget
+
+    Parameter centroids: The centroids to compare against
+    Precondition: centroids is a non-empty 2d numpy array with the same number of
+    columns as points
+    """
+    return a6metric.square_distances(points, centroids)
+
+
+def _weighted_choice(weights, exclude):
+    """
+    Returns a random position in weights, chosen with probability proportional to weight.
+
+    If all weights are 0, this picks a position uniformly among those not in exclude.
+
+    Parameter weights: The (unnormalized) probabilities
+    Precondition: weights is a 1d numpy array of numbers >= 0
+
+    Parameter exclude: The positions to avoid when all weights are 0
+    Precondition: exclude is a list of positions, shorter than weights
+    """
+    cumulative = numpy.cumsum(weights)
+    total = cumulative[-1]
+    if total > 0:
+        pos = int(numpy.searchsorted(cumulative, random.random()*total, side='right'))
+        if pos < len(weights) and weights[pos] > 0:
+            return pos
+        # Rounding put us past the end; take the last candidate with any weight
+        return int(numpy.flatnonzero(weights > 0)[-1])
+    used = set(exclude)
+    return random.choice([pos for pos in range(len(weights)) if not pos in used])
+
+
+def plus_plus_seeds(points, k, weights=None, metric=None):
+    """
+    Returns a list of k distinct positions in points chosen by k-means++ seeding.
+
+    The first seed is chosen at random (proportional to weight).  Every other seed is
+    chosen with probability proportional to its weight times the squared distance to
+    the nearest seed picked so far (or its cost, if a metric is given).  This spreads
+    the seeds over the data, and k-means started from them typically needs far fewer
+    steps to converge.
+
+    Parameter points: The candidate points
+    Precondition: points is a 2d numpy array with at least k rows
+
+    Parameter k: The number of seeds
+    Precondition: k is an int > 0
+
+    Parameter weights: The weight of each point (OPTIONAL)
+    Precondition: weights is None or a 1d numpy array of numbers >= 0, one per point
+
+    Parameter metric: The distance measure (OPTIONAL)
+    Precondition: metric is None (euclidean) or an a6metric.Metric
+    """
+    if weights is None:
+        weights = numpy.ones(len(points))
+    # The distances to a seed are computed a block of rows at a time, so that a
+    # numpy.memmap is never copied into memory whole
+    measure = lambda pos: nearest_centroids(points, points[pos:pos+1], metric)[1]
+    seeds = [_weighted_choice(weights, [])]
+    dists = measure(seeds[0])
+    for i in range(1, k):
+        seeds.append(_weighted_choice(weights*dists, seeds))
+        dists = numpy.minimum(dists, measure(seeds[-1]))
+    return seeds
+
+
+def parallel_seeds(points, k, rounds=5, factor=2, metric=None, weights=None):
+    """
+    Returns a list of k distinct positions in points chosen by k-means|| seeding.
+
+    Instead of picking one seed per pass like k-means++, each of the rounds passes
+    samples every point independently, with probability factor*k times its share of
+    the total squared distance to the candidates so far.  That gives about factor*k
+    new candidates per round.  The candidates are then weighted by the number of
+    points nearest to them, and k-means++ picks the final k seeds among them.  Each
+    pass is a single vectorized operation over the data, so this needs O(rounds)
+    passes instead of the k passes of k-means++.
+
+    If weights are given, the first candidate is chosen proportional to weight, each
+    point is sampled with its weight times its squared distance, and the candidates
+    are weighted by the total weight of the points nearest to them, as in
+    plus_plus_seeds.
+
+    Parameter points: The candidate points
+    Precondition: points is a 2d numpy array with at least k rows
+
+    Parameter k: The number of seeds
+    Precondition: k is an int > 0
+
+    Parameter rounds: The number of sampling rounds (OPTIONAL)
+    Precondition: rounds is an int >= 0
+
+    Parameter factor: The oversampling factor (OPTIONAL)
+    Precondition: factor is a number > 0
+
+    Parameter metric: The distance measure, in place of squared distance (OPTIONAL)
+    Precondition: metric is None (euclidean) or an a6metric.Metric
+
+    Parameter weights: The weight of each point (OPTIONAL)
+    Precondition: weights is None or a 1d numpy array of numbers >= 0, one per point
+    """
+    # Draw from the random module, so that random.seed makes this repeatable
+    generator = numpy.random.default_rng(random.getrandbits(64))
+    size  = len(points)
+    chosen = [random.randrange(size) if weights is None else _weighted_choice(weights, [])]
+    dists = nearest_centroids(points, points[chosen], metric)[1]
+    for i in range(rounds):
+        mass  = dists if weights is None else weights*dists
+        total = mass.sum()
+        if total <= 0:
+            break
+        probs = numpy.minimum(1.0, factor*k*mass/total)
+        fresh = numpy.flatnonzero(generator.random(size) < probs).tolist()
+        if fresh:
+            chosen.extend(fresh)
+            dists = numpy.minimum(dists, nearest_centroids(points, points[fresh], metric)[1])
+
+    if len(chosen) < k:
+        used = set(chosen)
+        rest = [pos for pos in range(size) if not pos in used]
+        chosen.extend(random.sample(rest, k-len(chosen)))
+
+    labels = nearest_labels(points, points[chosen], metric)
+    counts = numpy.bincount(labels, weights=weights, minlength=len(chosen)).astype(float)
+    # A candidate may lose all its points to an identical earlier one
+    counts = numpy.maximum(counts, 1e-12)
+    return [chosen[pos] for pos in plus_plus_seeds(points[chosen], k, counts, metric)]
+
+
+def coreset(dset, size, minimum=1):
+    """
+    Returns a weighted Dataset of at most size points that summarizes dset for k-means.
+
+    This is the lightweight coreset of Bachem, Lucic and Krause (2018).  Each point x
+    of weight w(x) is sampled (with replacement) with probability
+
+        q(x) = 1/2 * w(x)/W + 1/2 * w(x)*d(x,mu)^2 / sum(w*d^2)
+
+    where W is the total weight and mu is the (weighted) mean of dset, so both typical
+    points and far away points are represented.  A sampled point gets the weight
+    w(x)/(size*q(x)), so that the inertia of any clustering of the summary is an
+    unbiased estimate of its inertia on dset.  Points sampled more than once appear
+    once, with their weights added.
+
+    As points may be sampled more than once, the summary can have fewer than size
+    points.  If it has fewer than minimum, more samples are drawn, one at a time in
+    effect, until it has minimum points, and size in the weights above becomes the
+    number of samples drawn.  Use the number of clusters as minimum, so that the
+    summary can be clustered.
+
+    The error bound: there is a constant c such that, for eps and delta in (0,1), if
+    size >= c*(d*k*log(k)+log(1/delta))/eps^2, then with probability at least 1-delta,
+    EVERY set Q of k centroids satisfies
+
+        |inertia(summary, Q) - inertia(dset, Q)| <= eps/2*inertia(dset, Q)
+                                                    + eps/2*inertia(dset, {mu})
+
+    Hence the centroids found on the summary are within that error of optimal on dset.
+    The second term is a fraction of the total variance of the data (the inertia for
+    k = 1), not of the k-means inertia, so the bound is weaker when the clusters are
+    very tight compared to the spread of the data.
+
+    The dataset is read in two vectorized passes, which work on a numpy.memmap.  The
+    sample is drawn from the random module, so random.seed makes it repeatable.  If
+    dset has at most size points, the result is simply a copy of it.
+
+    Parameter dset: the dataset to summarize
+    Precondition: dset is an instance of Dataset, with a positive total weight
+
+    Parameter size: the number of samples
+    Precondition: size is an int > 0
+
+    Parameter minimum: the least number of points in the summary (OPTIONAL)
+    Precondition: minimum is an int, 0 < minimum <= size, and dset has at least minimum
+    points of positive weight
+    """
+    assert isinstance(dset, a6dataset.Dataset)
+    assert isinstance(size, int) and size > 0
+    assert isinstance(minimum, int) and 0 < minimum <= size
+    points  = dset.getArray()
+    weights = dset.getWeights()
+    if dset.getSize() <= size:
+        return a6dataset.Dataset(dset.getDimension(), points, 'array', weights,
+                                 dset.getPrecision())
+
+    total = float(weights.sum())
+    assert total > 0, 'the dataset has no weight'
+    mean  = label_sums(points, numpy.zeros(len(points), dtype=int), 1, weights)/total
+    dists = nearest_centroids(points, mean)[1]*weights
+    spread = float(dists.sum())
+    probs = weights/total
+    if spread > 0:
+        probs = probs/2+dists/(2*spread)
+    probs = probs/probs.sum()
+
+    assert numpy.count_nonzero(probs) >= minimum, \
+        'the dataset has fewer than %d points of positive weight' % minimum
+
+    generator = numpy.random.default_rng(random.getrandbits(64))
+    draws = generator.choice(len(points), size, p=probs)
+    while len(numpy.unique(draws)) < minimum:
+        draws = numpy.concatenate([draws, generator.choice(len(points), size, p=probs)])
+        # Stop at the draw that brings the minimum-th distinct point
+        first = numpy.sort(numpy.unique(draws, return_index=True)[1])
+        if len(first) >= minimum:
+            draws = draws[:first[minimum-1]+1]
+    chosen, counts = numpy.unique(draws, return_counts=True)
+    scale = counts*weights[chosen]/(len(draws)*probs[chosen])
+    return a6dataset.Dataset(dset.getDimension(), points[chosen], 'array', scale,
+                             dset.getPrecision())
+
+
+# The dataset shared by the worker processes of run_restarts
+_WORKER_DATASET = None
+
+
+def run_restarts(dset, k, restarts, maxstep, processes=None, **options):
+    """
+    Returns a pair (algorithm, inertia) for the best of several k-means runs.
+
+    This method runs k-means restarts times from different random seeds, and keeps the
+    clustering with the lowest within-cluster sum of squares (see getInertia).  The
+    restarts run concurrently in up to processes worker processes.  The dataset is sent
+    to each worker once, not once per restart.
+
+    The result is a new Algorithm whose clusters hold the winning partition, and its
+    inertia.  The seeds of the restarts are drawn from the random module, so the result
+    is repeatable after random.seed, whatever the number of processes.
+
+    Parameter dset: the dataset
+    Precondition: dset is an instance of Dataset
+
+    Parameter k: the number of clusters
+    Precondition: k is an int, 0 < k <= dset.getSize()
+
+    Parameter restarts: the number of independent runs
+    Precondition: restarts is an int > 0
+
+    Parameter maxstep: the maximum number of steps of each run
+    Precondition: maxstep is an int >= 0
+
+    Parameter processes: the number of worker processes (OPTIONAL)
+    Precondition: processes is None (one per CPU) or an int > 0
+
+    Parameter options: the keyword arguments init, engine, workers, metric, minibatch
+    and tolerance (OPTIONAL)
+    Precondition: init, engine, workers and metric are as in Algorithm, minibatch is None
+    or an int > 0 (and None unless metric is in a6metric.MEAN_METRICS), and tolerance is
+    None or a shift tolerance for run
+    """
+    assert isinstance(dset, a6dataset.Dataset)
+    assert isinstance(restarts, int) and restarts > 0
+    assert processes is None or (isinstance(processes, int) and processes > 0)
+    assert not options.get('minibatch') or \
+        options.get('metric', 'euclidean') in a6metric.MEAN_METRICS, \
+        'mini-batch steps need a metric whose center is the mean'
+    jobs = [(k, maxstep, random.getrandbits(32), options) for i in range(restarts)]
+    if restarts == 1 or processes == 1:
+        # The jobs reseed the random module, so restore the stream of the caller
+        state = random.getstate()
+        _share_dataset(dset)
+        try:
+            results = list(map(_restart_job, jobs))
+        finally:
+            _share_dataset(None)
+            random.setstate(state)
+    else:
+        with concurrent.futures.ProcessPoolExecutor(processes, initializer=_share_dataset,
+                                                    initargs=(dset,)) as pool:
+            results = list(pool.map(_restart_job, jobs))
+
+    # The first of the lowest wins, so the choice does not depend on the scheduling
+    inertias = [result[0] for result in results]
+    best = results[inertias.index(min(inertias))][1]
+
+    options = dict(options)
+    options.pop('minibatch', None)
+    options.pop('tolerance', None)
+    result = Algorithm(dset, k, list(range(k)), **options)
+    for pos in range(k):
+        result.getClusters()[pos].setCentroid(best[pos])
+    result._partition()
+    return (result, result.getInertia())
+
+
+def _share_dataset(dset):
+    """
+    Stores dset as the dataset of the restarts run in this process.
+
+    Parameter dset: the dataset
+    Precondition: dset is an instance of Dataset, or None to release it
+    """
+    global _WORKER_DATASET
+    _WORKER_DATASET = dset
+
+
+def _restart_job(job):
+    """
+    Returns a pair (inertia, centroids) for one k-means run of run_restarts.
+
+    Parameter job: the run to perform
+    Precondition: job is a tuple (k, maxstep, seed, options) as built by run_restarts
+    """
+    k, maxstep, seed, options = job
+    options = dict(options)
+    minibatch = options.pop('minibatch', None)
+    tolerance = options.pop('tolerance', None)
+    random.seed(seed)
+    km = Algorithm(_WORKER_DATASET, k, **options)
+    if minibatch:
+        km.runMiniBatch(maxstep, minibatch)
+    else:
+        km.run(maxstep, shift=tolerance)
+    return (km.getInertia(), [acluster.getCentroid() for acluster in km.getClusters()])
+
+
+def silhouette(points, labels, metric=None, weights=None):
+    """
+    Returns the (weighted) mean silhouette of the labeled points, or None if the points
+    have fewer than two labels.
+
+    The silhouette of a point is (b-a)/max(a,b), where a is the mean distance to the
+    other points with its label, and b is the least mean distance to the points of
+    another label.  It is 0 for a point alone with its label.  Scores near 1 mean tight,
+    well separated clusters.  This compares every pair of points, so it is meant for a
+    sample of at most a few thousand points (see select_k).  The distances are computed
+    a block of rows at a time, like nearest_labels.
+
+    Parameter points: The points
+    Precondition: points is a non-empty 2d numpy array of numbers
+
+    Parameter labels: The label of each point
+    Precondition: labels is a 1d numpy array of ints >= 0, one per point
+
+    Parameter metric: The distance measure (OPTIONAL)
+    Precondition: metric is None (euclidean) or an a6metric.Metric
+
+    Parameter weights: The weight of each point (OPTIONAL)
+    Precondition: weights is None or a 1d numpy array of numbers >= 0, one per point,
+    with a positive sum
+    """
+    if metric is None:
+        metric = a6metric.get_metric('euclidean')
+    if weights is None:
+        weights = numpy.ones(len(points))
+    present, labels = numpy.unique(labels, return_inverse=True)
+    if len(present) < 2:
+        return None
+    member = numpy.zeros((len(points), len(present)))
+    member[numpy.arange(len(points)), labels] = weights
+    # totals[i,c] is the weighted sum of the distances from point i to label c; the
+    # distances are computed a block of rows at a time, within the memory budget
+    totals = numpy.zeros(member.shape)
+    rows = block_rows(points)
+    for start in range(0, len(points), rows):
+        block = points[start:start+rows]
+        totals[start:start+rows] = numpy.dot(metric.distances(block, points), member)
+    mass = member.sum(axis=0)
+    rows = numpy.arange(len(points))
+    others = mass[labels]-weights
+    inside = numpy.divide(totals[rows, labels], others, out=numpy.zeros(len(points)),
+                          where=others > 0)
+    means = numpy.divide(totals, mass, out=numpy.full(totals.shape, numpy.inf),
+                         where=mass > 0)
+    means[rows, labels] = numpy.inf
+    nearest = means.min(axis=1)
+    scale = numpy.maximum(inside, nearest)
+    scores = numpy.divide(nearest-inside, scale, out=numpy.zeros(len(points)),
+                          where=(others > 0) & (scale > 0))
+    return float(numpy.dot(scores, weights)/weights.sum())
+
+
+def select_k(dset, kvalues, maxstep=100, threads=None, sample=1000, tolerance=None,
+             **options):
+    """
+    Returns a pair (k, curve) recommending the number of clusters for dset.
+
+    This runs k-means once for every value in kvalues, concurrently in up to threads
+    threads.  The threads share dset, so it is never copied, and numpy releases the
+    interpreter lock for the distance computations.  All runs are seeded in this thread,
+    in the order of kvalues, so the result is repeatable after random.seed.
+
+    curve is a list with a dictionary for each value in kvalues, in the same order.  It
+    has the keys 'k', 'inertia' (see getInertia), 'silhouette', 'steps' and 'converged'
+    (the result of run).  The silhouettes are computed on one random sample of at most
+    sample points, shared by all k so that they are comparable; 'silhouette' is None
+    when k is 1.  The recommended k is the one of highest silhouette (the smallest of
+    them, if there are ties).  If no k has a silhouette, it is the smallest k.  The
+    inertias are the elbow curve, for those who prefer to judge it by eye.
+
+    Parameter dset: the dataset
+    Precondition: dset is an instance of Dataset
+
+    Parameter kvalues: the numbers of clusters to try
+    Precondition: kvalues is a non-empty list of distinct ints, 0 < k <= dset.getSize()
+
+    Parameter maxstep: the maximum number of steps of each run (OPTIONAL)
+    Precondition: maxstep is an int > 0
+
+    Parameter threads: the number of threads (OPTIONAL)
+    Precondition: threads is None (one per CPU) or an int > 0
+
+    Parameter sample: the most points to compute silhouettes on (OPTIONAL)
+    Precondition: sample is an int > 1
+
+    Parameter tolerance: the centroid shift that counts as converged (OPTIONAL)
+    Precondition: tolerance is None or a number >= 0
+
+    Parameter options: the keyword arguments init, engine, workers and metric of
+    Algorithm (OPTIONAL)
+    Precondition: the options are as in Algorithm
+    """
+    assert isinstance(dset, a6dataset.Dataset)
+    assert isinstance(kvalues, list) and len(kvalues) > 0
+    assert len(set(kvalues)) == len(kvalues), 'the values of k are not distinct'
+    assert threads is None or (isinstance(threads, int) and threads > 0)
+    assert isinstance(maxstep, int) and maxstep > 0
+    assert isinstance(sample, int) and sample > 1
+    runs = [Algorithm(dset, k, **options) for k in kvalues]
+
+    points  = dset.getArray()
+    weights = dset.getWeights()
+    chosen  = numpy.arange(len(points))
+    if len(points) > sample:
+        generator = numpy.random.default_rng(random.getrandbits(64))
+        chosen = numpy.sort(generator.choice(len(points), sample, replace=False))
+
+    def evaluate(km):
+        converged = km.run(maxstep, shift=tolerance)
+        score = silhouette(points[chosen], km._labels[chosen], km._metric, weights[chosen])
+        return {'k': len(km.getClusters()), 'inertia': km.getInertia(), 'silhouette': score,
+                'steps': len(km.getHistory()), 'converged': converged}
+
+    with concurrent.futures.ThreadPoolExecutor(threads or os.cpu_count() or 1) as pool:
+        curve = list(pool.map(evaluate, runs))
+
+    scored = [entry for entry in curve if entry['silhouette'] is not None]
+    if not scored:
+        return (min(kvalues), curve)
+    best = max([entry['silhouette'] for entry in scored])
+    return (min([entry['k'] for entry in scored if entry['silhouette'] == best]), curve)
 
 
 class Algorithm(object):
@@ -26,17 +690,60 @@ class Algorithm(object):
     INSTANCE ATTRIBUTES:
         _dataset [Dataset]: the dataset which this is a clustering of
         _clusters [list of Cluster]: the clusters in this clustering (not empty)
+        _counts [list of number]: the weight of the points each cluster has absorbed in
+                               mini-batch steps (same length as _clusters)
+        _engine [str]: the partitioning engine, one of ENGINES
+        _metric [Metric]: the distance measure, from a6metric
+        _workers [int]: the number of threads used by the 'lloyd' engine
+        _bounds [Bounds or None]: the distance bounds of the 'hamerly' engine, or None
+                                  if they have not been computed yet
+        _labels [numpy array of int or None]: the cluster position of each point in the
+                                  last partition, or None if there was none yet
+        _changed [int]: the number of points whose cluster changed in the last partition
+        _inertia [float]: the sum of squared distances from the points to their
+                          nearest centroids in the last partition
+        _history [list of dict]: the statistics of every step so far (see getHistory)
+        _evaluations [int]: the number of point-centroid distances computed by the last
+                            partition
+        _listeners [list of callable]: the functions that receive events (see
+                                       addListener)
     """
 
+    # The supported values for the init parameter
+    INIT_MODES = ('random', 'k-means++', 'k-means||')
+    # The supported values for the engine parameter
+    ENGINES = ('lloyd', 'hamerly', 'kdtree')
+
     # Part A
-    def __init__(self, dset, k, seeds=None):
+    def __init__(self, dset, k, seeds=None, init='random', engine='lloyd', workers=1,
+                 metric='euclidean'):
         """
         Initializes the algorithm for the dataset ds, using k clusters.
 
         If the optional argument seeds is supplied, it will be a list of indices into the
         dataset that specifies which points should be the initial cluster centroids.
-        Otherwise, the clusters are initialized by randomly selecting k different points
-        from the database to be the cluster centroids.
+        Otherwise, the clusters are initialized by selecting k different points from the
+        database to be the cluster centroids.  The optional argument init says how they
+        are selected: 'random' picks them uniformly at random, while 'k-means++' and
+        'k-means||' use the seeding strategies of plus_plus_seeds and parallel_seeds.
+
+        The optional argument engine chooses how _partition() finds the nearest cluster
+        of each point.  The 'lloyd' engine compares every point to every centroid.  The
+        'hamerly' engine keeps distance bounds between steps (see the class Bounds) to
+        skip most of those comparisons.  The 'kdtree' engine builds a CentroidTree over
+        the centroids in every partition, so each point is only compared to the nearby
+        centroids; it is fastest in 2 or 3 dimensions with many clusters.  All engines
+        produce the same partitions.
+
+        The optional argument workers is the number of threads the 'lloyd' engine
+        spreads the dataset over (see _shardedLabels).
+
+        The optional argument metric is the name of the distance measure (see a6metric).
+        Points go to the centroid of least cost for it, and each centroid is updated
+        to the best center for its metric: the mean for 'euclidean', 'sqeuclidean' and
+        'mahalanobis', the median for 'manhattan' and the normalized mean direction for
+        'cosine'.  The 'hamerly' and 'kdtree' engines only support the euclidean
+        metrics.
 
         Parameter dset: the dataset
         Precondition: dset is an instance of Dataset
@@ -46,17 +753,56 @@ class Algorithm(object):
 
         Paramter seeds: the initial cluster indices (OPTIONAL)
         Precondition seeds is None, or a list of k valid indices into dset.
+
+        Parameter init: the seeding strategy when seeds is None (OPTIONAL)
+        Precondition: init is one of the strings in INIT_MODES
+
+        Parameter engine: the partitioning engine (OPTIONAL)
+        Precondition: engine is one of the strings in ENGINES
+
+        Parameter workers: the number of threads for partitioning (OPTIONAL)
+        Precondition: workers is an int > 0
+
+        Parameter metric: the distance measure (OPTIONAL)
+        Precondition: metric is one of the strings in a6metric.METRICS, and it is
+        'euclidean' or 'sqeuclidean' for the 'hamerly' and 'kdtree' engines
         """
         assert isinstance(dset, a6dataset.Dataset)
         self._dataset= dset
         self._clusters=[]
         assert isinstance(k, int) and k>0 and k<= self._dataset.getSize()
+        assert init in self.INIT_MODES, repr(init)+' is not a seeding strategy'
+        assert engine in self.ENGINES, repr(engine)+' is not an engine'
+        assert isinstance(workers, int) and workers > 0
+        assert metric in a6metric.METRICS, repr(metric)+' is not a metric'
+        assert engine == 'lloyd' or metric in ('euclidean', 'sqeuclidean'), \
+            'the %s engine needs a euclidean metric' % engine
+        if metric == 'mahalanobis':
+            self._metric= a6metric.get_metric(metric, dset.getArray(), self._weights())
+        else:
+            self._metric= a6metric.get_metric(metric)
         if seeds != None:
             assert a6checks.is_seed_list(seeds, k, self._dataset.getSize())
+        elif init == 'k-means++':
+            seeds= plus_plus_seeds(self._dataset.getArray(), k, self._weights(),
+                                   self._seedMetric())
+        elif init == 'k-means||':
+            seeds= parallel_seeds(self._dataset.getArray(), k, metric=self._seedMetric(),
+                                  weights=self._weights())
         else:
             seeds= random.sample(range(self._dataset.getSize()), k)
         for apoint in seeds:
             self._clusters.append(a6cluster.Cluster(self._dataset, self._dataset.getPoint(apoint) ))
+        self._counts= [0]*k
+        self._engine= engine
+        self._workers= workers
+        self._bounds= None
+        self._labels= None
+        self._changed= 0
+        self._inertia= 0.0
+        self._history= []
+        self._evaluations= 0
+        self._listeners= []
 
 
     def getClusters(self):
@@ -68,38 +814,268 @@ class Algorithm(object):
         """
         return self._clusters
 
+    def getInertia(self):
+        """
+        Returns the within-cluster sum of squares of this clustering.
+
+        This is the sum, over all clusters, of the squared distances from the points
+        in the cluster to its centroid.  Lower values mean tighter clusters.  In a
+        weighted dataset, each squared distance is multiplied by the weight of its point.
+        For other metrics than 'euclidean', the squared distance is replaced by the cost
+        of the metric (see a6metric).
+        """
+        # Label the points by cluster, so the dataset is read once and never gathered
+        labels = numpy.full(self._dataset.getSize(), -1)
+        for pos in range(len(self._clusters)):
+            labels[self._clusters[pos].getIndices()] = pos
+        metric = None if self._metric.NAME in ('euclidean', 'sqeuclidean') else self._metric
+        return label_inertia(self._dataset.getArray(), self._centroids(), labels,
+                             self._weights(), metric)
+
+    def getHistory(self):
+        """
+        Returns a list with the statistics of every step() taken so far.
+
+        Each item is a dictionary with the keys
+            'step':     the number of the step, starting at 1
+            'inertia':  the sum of squared distances from the points to their nearest
+                        centroids when they were partitioned in this step
+            'changed':  the fraction of points whose cluster changed in this step
+                        (1.0 in the first step)
+            'shift':    the largest distance that a centroid moved in this step
+            'converged': True if no centroid moved at all
+
+        The list is a copy, and it is not cleared by run().
+        """
+        return [dict(stats) for stats in self._history]
+
+    def addListener(self, listener):
+        """
+        Adds a function to call with the profiling events of this algorithm.
+
+        Each event is a dictionary, passed as the only argument of listener.  Every
+        event has the keys 'event' (its name), 'step' (the number of the step in
+        progress, starting at 1) and 'time' (the wall time in seconds of the phase it
+        reports).  The events are
+            'partition': sent by _partition(), with the keys
+                'distances':  the number of point-centroid distances computed
+                'reassigned': the number of points whose cluster changed
+                'empty':      the number of clusters left without points
+                'inertia':    as in getHistory()
+            'update':    sent by _update() after the centroids are recomputed (its time
+                         does not include the partition), with the key
+                'moved':      the number of centroids that changed
+            'step':      sent by step(), with the keys of getHistory() (its time is the
+                         whole step)
+            'absorb':    sent by resume() when it adds new points, with the keys
+                'points':     the number of new points
+                'distances':  the number of point-centroid distances computed
+
+        Parameter listener: the function to call
+        Precondition: listener is a callable that takes one argument
+        """
+        assert callable(listener), repr(listener)+' is not callable'
+        self._listeners.append(listener)
+
+    def removeListener(self, listener):
+        """
+        Removes a function added with addListener.
+
+        Parameter listener: the function to remove
+        Precondition: listener was added with addListener
+        """
+        self._listeners.remove(listener)
+
+    def _emit(self, name, start, **stats):
+        """
+        Sends an event to every listener.
+
+        Parameter name: the event name
+        Precondition: name is a string
+
+        Parameter start: the time.perf_counter() value when the phase started
+        Precondition: start is a float
+
+        Parameter stats: the remaining keys of the event
+        Precondition: stats are numbers or bools
+        """
+        if not self._listeners:
+            return
+        event = {'event': name, 'step': len(self._history)+1,
+                 'time': time.perf_counter()-start}
+        event.update(stats)
+        for listener in self._listeners:
+            listener(event)
+
 
     # Part B
     def _nearest(self, point):
         """
         Returns the cluster nearest to point
 
-        This method uses the distance method of each Cluster to compute the distance
-        between point and the cluster centroid. It returns the Cluster that is closest.
+        This method compares point to every cluster centroid at once, with the same
+        function (nearest_labels) as _partition. It returns the Cluster that is closest.
 
         Ties are broken in favor of clusters occurring earlier self._clusters.
 
         Parameter point: The point to compare.
-        Precondition: point is a list of numbers (int or float), with the same dimension
-        as the dataset.
+        Precondition: point is a list of numbers (int or float), or a 1d numpy array, with
+        the same dimension as the dataset.
         """
-        distance=[]
-        for acluster in self.getClusters():
-            distance.append(acluster.distance(point))
-        return self.getClusters()[distance.index(min(distance))]
+        dim = self._dataset.getDimension()
+        assert a6checks.is_trusted() or a6checks.is_point_vector(point, dim)
+        labels = nearest_labels(numpy.array([point], dtype=float), self._centroids(),
+                                self._metric)
+        return self.getClusters()[labels[0]]
+
+    def _centroids(self):
+        """
+        Returns the centroids of all clusters as a k x d numpy array.
+
+        Row i of the result is the centroid of the cluster self._clusters[i].
+        """
+        return numpy.array([acluster.getCentroid() for acluster in self._clusters],
+                           dtype=float)
+
+    def _seedMetric(self):
+        """
+        Returns the metric for the seeding functions: None for the euclidean metrics (so
+        that they use their own squared distances), or _metric.
+        """
+        return None if self._metric.NAME in ('euclidean', 'sqeuclidean') else self._metric
+
+    def _weights(self):
+        """
+        Returns the weights of the dataset as a numpy array, or None if it is not weighted.
+        """
+        return self._dataset.getWeights() if self._dataset.isWeighted() else None
 
     def _partition(self):
         """
         Repartitions the dataset so each point is in exactly one Cluster.
         """
-        # First, clear each cluster of its points.  Then, for each point in the
-        # dataset, find the nearest cluster and add the point to that cluster.
-
-        # IMPLEMENT ME
+        # First, clear each cluster of its points.  Then, label every point in the
+        # dataset with its nearest cluster in one batch, and add the points to the
+        # clusters in dataset order.  The points are summed per cluster while they are
+        # read, so no cluster has to gather its points again.
+        start = time.perf_counter()
         for acluster in self.getClusters():
             acluster.clear()
-        for aindex in range(self._dataset.getSize()):
-            self._nearest(self._dataset.getPoint(aindex)).addIndex(aindex)
+        points = self._dataset.getArray()
+        if self._engine == 'hamerly':
+            if self._bounds is None or self._bounds.getSize() != self._dataset.getSize():
+                self._bounds = Bounds(points, self._centroids())
+            else:
+                self._bounds.move(points, self._centroids())
+            self._evaluations = self._bounds.getEvaluations()
+            labels = self._bounds.getLabels()
+            sums = label_sums(points, labels, len(self._clusters), self._weights())
+            inertia = label_inertia(points, self._centroids(), labels, self._weights())
+        elif self._engine == 'kdtree':
+            tree = CentroidTree(self._centroids().astype(a6metric.compute_type(points)))
+            labels, dists = tree.query(points)
+            self._evaluations = tree.getEvaluations()
+            sums = label_sums(points, labels, len(self._clusters), self._weights())
+            weights = self._weights()
+            inertia = float(dists.sum() if weights is None else (dists*weights).sum())
+        elif self._workers > 1:
+            labels, sums, inertia = self._shardedLabels()
+            self._evaluations = len(points)*len(self._clusters)
+        else:
+            labels, sums, inertia = shard_sums(points, self._centroids(), self._weights(),
+                                               self._metric)
+            self._evaluations = len(points)*len(self._clusters)
+        if self._labels is None or len(self._labels) != len(labels):
+            self._changed = len(labels)
+        else:
+            self._changed = int(numpy.count_nonzero(self._labels != labels))
+        # The hamerly bounds update their labels in place, so keep a copy
+        self._labels = labels.copy()
+        self._inertia = inertia
+        self._assign(labels, sums)
+        self._emit('partition', start, distances=self._evaluations,
+                   reassigned=self._changed, inertia=inertia,
+                   empty=sum([1 for acluster in self._clusters if not acluster.getCount()]))
+
+    def _assign(self, labels, sums, offset=0):
+        """
+        Adds labeled points to the clusters.
+
+        The point at index offset+i in the dataset is added to cluster labels[i].  The
+        points are added to each cluster in dataset order.
+
+        Parameter labels: the cluster position of each point
+        Precondition: labels is a 1d numpy array of positions in _clusters, for the
+        points offset, offset+1, ... of the dataset, none of which are in a cluster
+
+        Parameter sums: the (weighted) sum of the points with each label
+        Precondition: sums is a k x d numpy array
+
+        Parameter offset: the index of the first labeled point (OPTIONAL)
+        Precondition: offset is an int >= 0
+        """
+        # A stable sort groups the indices by cluster, keeping dataset order
+        order  = numpy.argsort(labels, kind='stable')
+        starts = numpy.searchsorted(labels[order], numpy.arange(len(self._clusters)+1))
+        for pos in range(len(self._clusters)):
+            indices = (order[starts[pos]:starts[pos+1]]+offset).tolist()
+            self._clusters[pos].addIndices(indices, sums[pos])
+
+    def _absorb(self):
+        """
+        Returns the number of points added to the dataset since the last partition,
+        after adding them to their nearest clusters and updating the centroids.
+
+        Only the new points are compared to the centroids; the clusters keep their other
+        points.  The 'hamerly' engine also computes the bounds of the new points, so
+        that its next partition can skip them like the others.  If the dataset was never
+        partitioned, this does nothing and returns 0.
+        """
+        if self._labels is None or len(self._labels) >= self._dataset.getSize():
+            return 0
+        start  = time.perf_counter()
+        done   = len(self._labels)
+        points = self._dataset.getArray()
+        weights = self._weights()
+        part = None if weights is None else weights[done:]
+        labels, sums, inertia = shard_sums(points[done:], self._centroids(), part,
+                                           self._metric)
+        if self._engine == 'hamerly' and self._bounds is not None:
+            self._bounds.grow(points)
+        self._labels = numpy.concatenate([self._labels, labels])
+        self._assign(labels, sums, done)
+        for acluster in self._clusters:
+            self._recenter(acluster)
+        self._emit('absorb', start, points=len(labels), distances=len(labels)*len(sums))
+        return len(labels)
+
+    def _shardedLabels(self):
+        """
+        Returns a triple (labels, sums, inertia) computed by splitting the dataset over
+        _workers threads.
+
+        labels is as in nearest_labels for the whole dataset, sums[i] is the
+        (weighted) sum of the points nearest to cluster i, and inertia is as in
+        shard_sums.  Each thread labels one contiguous shard of the dataset and sums
+        its points per cluster; the partial sums are then added together.  The shards
+        are views of the dataset array, and numpy does not hold the interpreter lock
+        while it computes, so the threads run in parallel without copying the data.
+        """
+        points = self._dataset.getArray()
+        weights = self._weights()
+        centroids = self._centroids()
+        shard = -(-len(points) // self._workers)
+        starts = range(0, len(points), shard)
+        def work(start):
+            part = None if weights is None else weights[start:start+shard]
+            return shard_sums(points[start:start+shard], centroids, part, self._metric)
+        with concurrent.futures.ThreadPoolExecutor(self._workers) as pool:
+            parts = list(pool.map(work, starts))
+        labels = numpy.concatenate([part[0] for part in parts])
+        sums = parts[0][1]
+        for part in parts[1:]:
+            sums = sums+part[1]
+        return (labels, sums, sum(part[2] for part in parts))
 
 
     # Part C
@@ -111,24 +1087,64 @@ class Algorithm(object):
         checks whether any of them have changed. It then returns the appropriate value.
         """
         self._partition()
+        start = time.perf_counter()
         okay=True
+        moved=0
         for acluster in self._clusters:
-            okay *= (acluster.update())
+            same = self._recenter(acluster)
+            okay *= same
+            moved += not same
+        self._emit('update', start, moved=moved)
         return okay
 
+    def _recenter(self, acluster):
+        """
+        Returns True if the centroid of acluster is unchanged after it is moved to the
+        best center of its points; False otherwise.
+
+        For the metrics whose center is the mean, this is acluster.update(), which uses
+        the running sums.  For the others, the center is computed from the points of the
+        cluster by the metric.  An empty cluster (or one of weight 0) does not move.
+
+        Parameter acluster: the cluster to update
+        Precondition: acluster is one of the clusters of this algorithm
+        """
+        if self._metric.MEAN:
+            return acluster.update()
+        indices = acluster.getIndices()
+        weights = self._weights()
+        part = None if weights is None or not indices else weights[indices]
+        if not indices or (part is not None and part.sum() <= 0):
+            return True
+        center = self._metric.center(acluster.getArray(), part).tolist()
+        same = center == acluster.getCentroid()
+        acluster.setCentroid(center)
+        return same
+
     def step(self):
         """
         Returns True if the algorithm converges after one step; False otherwise.
 
         This method performs one cycle of the k-means algorithm. It then checks if
-        the algorithm has converged and returns the appropriate value.
+        the algorithm has converged and returns the appropriate value.  It also adds
+        the statistics of this step to the history (see getHistory).
         """
-
-        return self._update()
+        start = time.perf_counter()
+        before = self._centroids()
+        result = self._update()
+        shift = numpy.sqrt(((self._centroids()-before)**2).sum(axis=1)).max()
+        size = max(1, self._dataset.getSize())
+        stats = {'step': len(self._history)+1, 'inertia': self._inertia,
+                 'changed': self._changed/size, 'shift': float(shift),
+                 'converged': bool(result)}
+        self._emit('step', start, inertia=stats['inertia'], changed=stats['changed'],
+                   shift=stats['shift'], converged=stats['converged'])
+        self._history.append(stats)
+        return result
 
 
     # Part D
-    def run(self, maxstep):
+    def run(self, maxstep, shift=None, improvement=None, changed=None):
         """
         Continues clustering until either it converges or maxstep steps
         (which ever comes first).
@@ -137,14 +1153,464 @@ class Algorithm(object):
         algorithm converges. It stops after maxstep iterations even if the
         algorithm has not converged.
 
+        By default, the algorithm has converged when no centroid moves at all.  The
+        optional tolerances relax this, so that a run can stop once the clustering has
+        settled, instead of chasing floating point noise.  The algorithm has converged
+        after a step as soon as one of the given tolerances is met:
+            shift:       no centroid moved farther than shift
+            improvement: the inertia improved by at most this fraction of the inertia
+                         of the previous step
+            changed:     at most this fraction of the points changed cluster
+        The statistics of each step are available from getHistory().
+
+        Returns True if the algorithm converged; False otherwise.
+
         Parameter maxstep: the maximum number of steps to try
         Precondition: maxstep is an int >= 0
-        """
-        # You do not need a while loop for this.  Just write a for-loop, and exit
-        # the for-loop (with a return) if you finish early.
 
-        # IMPLEMENT ME
+        Parameter shift: the centroid shift tolerance (OPTIONAL)
+        Precondition: shift is None or a number >= 0
+
+        Parameter improvement: the relative inertia improvement tolerance (OPTIONAL)
+        Precondition: improvement is None or a number >= 0
+
+        Parameter changed: the tolerance for the fraction of changed points (OPTIONAL)
+        Precondition: changed is None or a number >= 0
+        """
         assert isinstance(maxstep, int) and maxstep>=0
+        for tol in (shift, improvement, changed):
+            assert tol is None or (type(tol) in a6checks.NUMBER_TYPES and tol >= 0)
         for i in range(maxstep):
             if self.step() == True:
                 return True
+            stats = self._history[-1]
+            if shift is not None and stats['shift'] <= shift:
+                return True
+            if changed is not None and stats['changed'] <= changed:
+                return True
+            if improvement is not None and i > 0:
+                previous = self._history[-2]['inertia']
+                if previous-stats['inertia'] <= improvement*previous:
+                    return True
+        return False
+
+
+    def resume(self, maxstep, shift=None, improvement=None, changed=None):
+        """
+        Continues clustering after points were added to the dataset.
+
+        This is a warm start: instead of starting over, the points added since the last
+        partition are first assigned to their nearest clusters, without looking at the
+        other points, and the centroids are updated.  Then clustering continues from
+        there, as in run(), which usually needs only a few steps.  With the 'hamerly'
+        engine these steps skip most distance computations, as the old points keep
+        their bounds.
+
+        Returns True if the algorithm converged; False otherwise, as in run().
+
+        The parameters are the same as for run().
+        """
+        self._absorb()
+        return self.run(maxstep, shift, improvement, changed)
+
+
+    # Mini-batch k-means
+    def stepMiniBatch(self, size):
+        """
+        Returns True if the centroids barely moved in one mini-batch step; False otherwise.
+
+        This method samples size random points from the dataset and moves each centroid
+        towards the points of the sample that are nearest to it.  Each cluster has its
+        own learning rate, which is the fraction of all points it has absorbed so far
+        that come from this sample.  Hence every centroid is the running average of
+        the sampled points assigned to it, as in mini-batch k-means.  In a weighted
+        dataset, the points are counted (and averaged) by weight.
+
+        A step does not repartition the dataset, so it takes time proportional to size
+        and not to the size of the dataset.  The clusters keep the points (and running
+        sums) of their last partition while their centroids move, so that membership is
+        stale until _partition() is called (runMiniBatch does this when it finishes).
+
+        Whether the centroids "barely moved" is determined by numpy.allclose.
+
+        Parameter size: the number of points in each batch
+        Precondition: size is an int > 0, and the metric is not 'manhattan' or 'cosine'
+        (whose centers are not running averages)
+        """
+        assert isinstance(size, int) and size > 0
+        assert self._metric.MEAN, 'mini-batch steps need a metric whose center is the mean'
+        indices = random.sample(range(self._dataset.getSize()), min(size, self._dataset.getSize()))
+        indices.sort()
+        points  = self._dataset.getArray()[indices]
+        weights = self._weights()
+        weights = numpy.ones(len(indices)) if weights is None else weights[indices]
+        before  = self._centroids()
+        labels  = nearest_labels(points, before, self._metric)
+
+        after = before.copy()
+        for pos in range(len(self._clusters)):
+            mask = labels == pos
+            total = weights[mask].sum()
+            if total <= 0:
+                continue
+            self._counts[pos] += total
+            rate = total/self._counts[pos]
+            mean = (points[mask]*weights[mask][:, numpy.newaxis]).sum(axis=0)/total
+            after[pos] += rate*(mean-before[pos])
+            self._clusters[pos].setCentroid(after[pos].tolist())
+        return bool(numpy.allclose(before, after))
+
+    def runMiniBatch(self, maxstep, size):
+        """
+        Returns True if mini-batch clustering converges within maxstep steps; False
+        otherwise.
+
+        This method calls stepMiniBatch() repeatedly, up to maxstep times, until the
+        centroids stop moving.  It then partitions the whole dataset once, so that the
+        clusters contain their points when it is done.
+
+        Parameter maxstep: the maximum number of steps to try
+        Precondition: maxstep is an int >= 0
+
+        Parameter size: the number of points in each batch
+        Precondition: size is an int > 0
+        """
+        assert isinstance(maxstep, int) and maxstep>=0
+        converged = False
+        for i in range(maxstep):
+            if self.stepMiniBatch(size):
+                converged = True
+                break
+        self._partition()
+        return converged
+
+
+class Bounds(object):
+    """
+    A class to skip distance computations in k-means, following Hamerly's algorithm.
+
+    For each point, this class remembers the nearest centroid, an upper bound on the
+    distance to it, and a lower bound on the distance to every other centroid.  When
+    the centroids move, the bounds are loosened by how far the centroids moved.  A
+    point keeps its nearest centroid without any distance computation if its upper
+    bound is below its lower bound, or below half the distance from its centroid to
+    the closest other centroid (by the triangle inequality).  Only the remaining points
+    are compared to the centroids.
+
+    The bound tests are strict (and slightly padded against rounding), so a point
+    only skips the comparison when its centroid is strictly nearest.  All other points
+    are labeled with square_distances, like nearest_labels.  Hence the labels are
+    exactly those of nearest_labels, including the tie-breaking rule.
+
+    INSTANCE ATTRIBUTES:
+        _labels [numpy array of int]: the position of the nearest centroid of each point
+        _upper [numpy array of float]: upper bounds on the distance to that centroid
+        _lower [numpy array of float]: lower bounds on the distance to any other centroid
+        _centroids [numpy array of float]: the centroids the bounds refer to
+        _evaluations [int]: the number of distances computed by the last move (or by
+                            the initializer)
+    """
+    # The least relative padding of the bound tests, to absorb rounding errors (it is
+    # larger for float32 points, see a6metric.rounding)
+    EPSILON = 1e-9
+
+    def __init__(self, points, centroids):
+        """
+        Initializes the bounds by comparing every point to every centroid.
+
+        Parameter points: The points
+        Precondition: points is a 2d numpy array of numbers
+
+        Parameter centroids: The centroids
+        Precondition: centroids is a non-empty 2d numpy array with the same number
+        of columns as points
+        """
+        size = len(points)
+        self._labels = numpy.zeros(size, dtype=int)
+        self._upper  = numpy.zeros(size)
+        self._lower  = numpy.zeros(size)
+        self._centroids = centroids.astype(a6metric.compute_type(points))
+        self._evaluations = 0
+        self._compare(points, numpy.arange(size))
+
+    def getSize(self):
+        """
+        Returns the number of points these bounds are for.
+        """
+        return len(self._labels)
+
+    def getLabels(self):
+        """
+        Returns the position of the nearest centroid of each point, as a numpy array.
+        """
+        return self._labels
+
+    def grow(self, points):
+        """
+        Adds bounds for the points after the first getSize() rows of points.
+
+        The new points are compared to the centroids that the bounds refer to, so that
+        all the bounds stay valid for the next move.
+
+        Parameter points: The points, the old ones followed by the new ones
+        Precondition: points is a 2d numpy array with at least getSize() rows
+        """
+        size  = self.getSize()
+        extra = len(points)-size
+        self._labels = numpy.concatenate([self._labels, numpy.zeros(extra, dtype=int)])
+        self._upper  = numpy.concatenate([self._upper, numpy.zeros(extra)])
+        self._lower  = numpy.concatenate([self._lower, numpy.zeros(extra)])
+        self._evaluations = 0
+        self._compare(points, numpy.arange(size, len(points)))
+
+    def getEvaluations(self):
+        """
+        Returns the number of distances computed by the last move (or the initializer).
+
+        This counts the distances between centroids, the distances that tighten upper
+        bounds, and the point-centroid distances of the full comparisons.
+        """
+        return self._evaluations
+
+    def move(self, points, centroids):
+        """
+        Updates the labels and bounds after the centroids moved to centroids.
+
+        Parameter points: The points (the same ones as before)
+        Precondition: points is a 2d numpy array with getSize() rows
+
+        Parameter centroids: The new centroids
+        Precondition: centroids is a 2d numpy array of the same shape as before
+        """
+        centroids = centroids.astype(self._centroids.dtype)
+        drift = numpy.sqrt(((centroids-self._centroids)**2).sum(axis=1))
+        self._centroids = centroids
+        self._evaluations = len(drift)
+        self._upper += drift[self._labels]
+        if len(drift) > 1:
+            # Each point loosens by the largest drift among the OTHER centroids
+            order = numpy.argsort(drift)
+            other = numpy.where(self._labels == order[-1], drift[order[-2]], drift[order[-1]])
+            self._lower -= other
+            gaps = numpy.sqrt(square_distances(centroids, centroids))
+            self._evaluations += gaps.size
+            numpy.fill_diagonal(gaps, numpy.inf)
+            half = gaps.min(axis=1)/2
+        else:
+            half = numpy.full(1, numpy.inf)
+
+        slack = max(self.EPSILON, a6metric.rounding(points))
+        limit = numpy.maximum(half[self._labels], self._lower)*(1-slack)
+        check = numpy.flatnonzero(~(self._upper < limit))
+        if len(check) == 0:
+            return
+
+        # Tighten the upper bound of the doubtful points, then compare the rest
+        exact = points[check]-centroids[self._labels[check]]
+        self._evaluations += len(check)
+        self._upper[check] = numpy.sqrt((exact*exact).sum(axis=1))
+        check = check[~(self._upper[check] < limit[check])]
+        self._compare(points, check)
+
+    def _compare(self, points, check):
+        """
+        Compares the points at positions check to every centroid.
+
+        This sets the labels of those points, and makes their bounds exact.
+
+        Parameter points: The points
+        Precondition: points is a 2d numpy array with getSize() rows
+
+        Parameter check: The positions of the points to compare
+        Precondition: check is a 1d numpy array of valid positions in points
+        """
+        self._evaluations += len(check)*len(self._centroids)
+        rows = block_rows(self._centroids)
+        for start in range(0, len(check), rows):
+            chunk = check[start:start+rows]
+            dists = square_distances(points[chunk], self._centroids)
+            best  = numpy.argmin(dists, axis=1)
+            self._labels[chunk] = best
+            self._upper[chunk]  = numpy.sqrt(dists[numpy.arange(len(best)), best])
+            if dists.shape[1] > 1:
+                self._lower[chunk] = numpy.sqrt(numpy.partition(dists, 1, axis=1)[:, 1])
+            else:
+                self._lower[chunk] = numpy.inf
+
+
+class CentroidTree(object):
+    """
+    A class to find the nearest centroid of many points with a KD-tree.
+
+    The tree splits the centroids in half, again and again, on the coordinate where
+    they are most spread out, until each leaf holds at most LEAF_SIZE centroids.  Each
+    leaf remembers the bounding box of its centroids.  To label a batch of points, the
+    points first descend the tree to the leaf they fall in, which gives a good first
+    guess.  Then a leaf is only searched for a point if its bounding box is (about) as
+    close as the best centroid found so far.  In low dimension, most points only search
+    one or two leaves, so the work no longer grows with k like a linear scan.
+
+    All the searches are vectorized over the points of a batch.  Distances are computed
+    with square_distances, and among centroids at the same distance the one occurring
+    first wins, so the labels are exactly those of nearest_labels.
+
+    INSTANCE ATTRIBUTES:
+        _centroids [numpy array of float]: the centroids
+        _leaves [list of numpy array of int]: the positions of the centroids in each
+                                              leaf, in increasing order
+        _lower [numpy array of float]: row i is the lower corner of the box of leaf i
+        _upper [numpy array of float]: row i is the upper corner of the box of leaf i
+        _dims [numpy array of int]: the split coordinate of each node (-1 for a leaf)
+        _splits [numpy array of float]: the split value of each node; a point goes to
+                                        the left child if its coordinate is <= this
+        _children [numpy array of int]: the left and right child of each node, or the
+                                        leaf number (twice) for a leaf
+        _evaluations [int]: the number of point-centroid distances computed by the last
+                            query
+    """
+    # The most centroids in a leaf
+    LEAF_SIZE = 8
+    # The least relative padding of the pruning test, to absorb rounding errors (it is
+    # larger for float32 points, see a6metric.rounding)
+    EPSILON = 1e-9
+
+    def __init__(self, centroids):
+        """
+        Initializes the tree for the given centroids.
+
+        float32 centroids are kept in float32, so that the tree searches float32 points
+        without converting them.
+
+        Parameter centroids: The centroids
+        Precondition: centroids is a non-empty 2d numpy array of numbers
+        """
+        self._centroids = numpy.array(centroids, dtype=a6metric.compute_type(centroids))
+        self._leaves = []
+        dims, splits, children = [], [], []
+        # Build the nodes breadth first; each node is a range of positions in order
+        order = numpy.arange(len(self._centroids))
+        pending = [order]
+        while pending:
+            group = pending.pop(0)
+            node = len(dims)
+            if len(group) <= self.LEAF_SIZE:
+                dims.append(-1)
+                splits.append(0.0)
+                children.append((len(self._leaves), len(self._leaves)))
+                self._leaves.append(numpy.sort(group))
+                continue
+            points = self._centroids[group]
+            dim = int(numpy.argmax(points.max(axis=0)-points.min(axis=0)))
+            group = group[numpy.argsort(points[:, dim], kind='stable')]
+            half = len(group)//2
+            dims.append(dim)
+            splits.append(float(self._centroids[group[half-1], dim]))
+            children.append((node+len(pending)+1, node+len(pending)+2))
+            pending.append(group[:half])
+            pending.append(group[half:])
+        self._dims = numpy.array(dims)
+        self._splits = numpy.array(splits)
+        self._children = numpy.array(children)
+        self._lower = numpy.array([self._centroids[leaf].min(axis=0) for leaf in self._leaves])
+        self._upper = numpy.array([self._centroids[leaf].max(axis=0) for leaf in self._leaves])
+        self._evaluations = 0
+
+    def getEvaluations(self):
+        """
+        Returns the number of point-centroid distances computed by the last query.
+        """
+        return self._evaluations
+
+    def query(self, points):
+        """
+        Returns a pair (labels, dists) for the nearest centroid of each point.
+
+        The result is the same as nearest_centroids(points, centroids).  The points are
+        read a block of rows at a time, so this works well on a numpy.memmap.
+
+        Parameter points: The points to label
+        Precondition: points is a 2d numpy array of numbers with the same number of
+        columns as the centroids
+        """
+        size = len(points)
+        labels = numpy.zeros(size, dtype=int)
+        dists  = numpy.zeros(size)
+        self._evaluations = 0
+        rows = max(1, BLOCK_BUDGET // max(1, len(self._leaves)))
+        for start in range(0, size, rows):
+            labels[start:start+rows], dists[start:start+rows] = self._search(points[start:start+rows])
+        return (labels, dists)
+
+    def _search(self, points):
+        """
+        Returns a pair (labels, dists) for the nearest centroid of each point.
+
+        Parameter points: The points to label
+        Precondition: points is a 2d numpy array, small enough that an n x (number of
+        leaves) array fits in the memory budget
+        """
+        size = len(points)
+        best  = numpy.full(size, numpy.inf)
+        label = numpy.zeros(size, dtype=int)
+
+        # Descend to the leaf of each point, and search it first
+        node = numpy.zeros(size, dtype=int)
+        inner = self._dims[node] >= 0
+        while inner.any():
+            where = numpy.flatnonzero(inner)
+            step = points[where, self._dims[node[where]]] > self._splits[node[where]]
+            node[where] = self._children[node[where], step.astype(int)]
+            inner = self._dims[node] >= 0
+        home = self._children[node, 0]
+        order = numpy.argsort(home, kind='stable')
+        starts = numpy.searchsorted(home[order], numpy.arange(len(self._leaves)+1))
+        for leaf in range(len(self._leaves)):
+            if starts[leaf] < starts[leaf+1]:
+                self._improve(points, order[starts[leaf]:starts[leaf+1]], leaf, best, label)
+
+        # Search the other leaves whose box is close enough.  The squared distance to
+        # each box is summed one coordinate at a time, to keep the temporaries small.
+        gap = numpy.zeros((len(self._leaves), size))
+        for dim in range(points.shape[1]):
+            coord = points[:, dim]
+            part  = numpy.maximum(self._lower[:, dim, numpy.newaxis]-coord, 0)
+            part += numpy.maximum(coord-self._upper[:, dim, numpy.newaxis], 0)
+            gap  += part*part
+        need = gap*(1-max(self.EPSILON, a6metric.rounding(points))) <= best
+        need[home, numpy.arange(size)] = False
+        for leaf in numpy.flatnonzero(need.any(axis=1)):
+            self._improve(points, numpy.flatnonzero(need[leaf]), leaf, best, label)
+        return (label, best)
+
+    def _improve(self, points, check, leaf, best, label):
+        """
+        Compares the points at positions check to the centroids of a leaf.
+
+        This updates best and label in place where a centroid of the leaf is closer, or
+        is as close and occurs earlier in the centroids.
+
+        Parameter points: The points
+        Precondition: points is a 2d numpy array
+
+        Parameter check: The positions of the points to compare
+        Precondition: check is a 1d numpy array of positions in points
+
+        Parameter leaf: The number of the leaf
+        Precondition: leaf is a valid leaf number
+
+        Parameter best: The squared distance to the best centroid so far, per point
+        Precondition: best is a 1d numpy array of floats with one value per point
+
+        Parameter label: The position of the best centroid so far, per point
+        Precondition: label is a 1d numpy array of ints with one value per point
+        """
+        members = self._leaves[leaf]
+        dists = square_distances(points[check], self._centroids[members])
+        self._evaluations += dists.size
+        # argmin picks the first of equal distances, and members are in order
+        pos = numpy.argmin(dists, axis=1)
+        near = dists[numpy.arange(len(check)), pos]
+        found = members[pos]
+        better = (near < best[check]) | ((near == best[check]) & (found < label[check]))
+        best[check[better]] = near[better]
+        label[check[better]] = found[better]
@@ -12,6 +12,47 @@ import random
 import numpy
 
 
+# The types that count as numbers in a point
+NUMBER_TYPES = (int, float)
+
+# Whether the data is trusted, so that hot paths may skip their checks (see set_trusted)
+_TRUSTED = False
+
+
+def set_trusted(flag):
+    """
+    Turns the "trusted data" mode on or off.
+
+    Checking a point walks every one of its coordinates, and methods like
+    Cluster.distance are called for every point and cluster in every step.  When the
+    data is known to be good (for example, because it was checked when it was loaded),
+    turning on trusted mode makes those methods skip their precondition checks.  See
+    is_trusted.
+
+    Entry points for outside data, like tools.read_dataset, check their input whatever
+    the mode.
+
+    Parameter flag: whether the data is trusted
+    Precondition: flag is a bool
+    """
+    global _TRUSTED
+    assert type(flag) == bool, repr(flag)+' is not a bool'
+    _TRUSTED = flag
+
+
+def is_trusted():
+    """
+    Returns True if the "trusted data" mode is on.
+
+    Methods on hot paths check their preconditions with
+
+        assert a6checks.is_trusted() or <check>
+
+    so that the check is skipped in trusted mode.
+    """
+    return _TRUSTED
+
+
 def is_point(value):
     """
     Returns True if value is a list of int or float
@@ -22,13 +63,12 @@ def is_point(value):
     if (type(value) != list):
         return False
 
-    # All float
-    okay = True
+    # All float (stop at the first value that is not)
     for x in value:
-        if (not type(x) in [int,float]):
-            okay = False
+        if (not type(x) in NUMBER_TYPES):
+            return False
 
-    return okay
+    return True
 
 
 # ADD MORE HELPER FUNCTIONS FOR ASSERTS HERE
@@ -46,13 +86,86 @@ def is_point_list(value):
     elif (len(value) == 0):
         return True
 
-    okay = True
     dim = len(value[0])
     for x in value:
-        if (len(x) != dim or not is_point(x)):
-            okay = False
+        if (not is_point(x) or len(x) != dim):
+            return False
 
-    return okay
+    return True
+
+
+def is_point_array(value, dim):
+    """
+    Returns True if value is a 2d numpy array of numbers with dim columns
+
+    This only looks at the shape and type of the array, so it takes constant time
+    however large the array is.
+
+    Parameter value: a value to check
+    Precondition: value can be anything
+
+    Parameter dim: the required number of columns
+    Precondition: dim is an int > 0
+    """
+    if (not isinstance(value, numpy.ndarray)):
+        return False
+    elif (value.ndim != 2 or value.shape[1] != dim):
+        return False
+
+    return value.dtype.kind in 'iuf'
+
+
+def is_point_vector(value, dim):
+    """
+    Returns True if value is a point with dim coordinates, as a list or a numpy array.
+
+    A list must satisfy is_point.  A numpy array must be 1d with a numeric type, which
+    is checked in constant time.
+
+    Parameter value: a value to check
+    Precondition: value can be anything
+
+    Parameter dim: the required number of coordinates
+    Precondition: dim is an int > 0
+    """
+    if isinstance(value, numpy.ndarray):
+        return value.shape == (dim,) and value.dtype.kind in 'iuf'
+
+    return is_point(value) and len(value) == dim
+
+
+def is_finite_array(value):
+    """
+    Returns True if value is a numpy array of numbers with no NaN or infinite values
+
+    This is a strict check for data from outside, like a parsed file.  It is done with
+    one vectorized pass over the array.
+
+    Parameter value: a value to check
+    Precondition: value can be anything
+    """
+    if (not isinstance(value, numpy.ndarray) or not value.dtype.kind in 'iuf'):
+        return False
+
+    return bool(numpy.isfinite(value).all())
+
+
+def is_weight_array(value, size):
+    """
+    Returns True if value is a 1d numpy array of size finite numbers >= 0
+
+    Parameter value: a value to check
+    Precondition: value can be anything
+
+    Parameter size: the required number of weights
+    Precondition: size is an int >= 0
+    """
+    if (not isinstance(value, numpy.ndarray) or value.shape != (size,)):
+        return False
+    elif (not is_finite_array(value)):
+        return False
+
+    return bool((value >= 0).all())
 
 
 def is_seed_list(value, k, size):
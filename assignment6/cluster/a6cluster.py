@@ -32,13 +32,32 @@ class Cluster(object):
     the centroid is generally not a point in the dataset, but rather is usually in between
     the data points.)
 
+    The cluster also keeps the running sum of its points, which is updated whenever an
+    index is added or removed.  That way update() can recompute the centroid without
+    looking at the points again.  If the dataset is weighted, this is the weighted sum,
+    together with the total weight of the points, so that the centroid is their
+    weighted average.
+
+    Finally, the cluster caches the statistics derived from its points (see getArray,
+    getBounds and getRadius), so asking for them again is free.  The cache is cleared
+    whenever the points change, and the radius is also recomputed when the centroid
+    changes.
+
     INSTANCE ATTRIBUTES:
         _dataset [Dataset]: the dataset this cluster is a subset of
         _indices [list of int]: the indices of this cluster's points in the dataset
         _centroid [list of numbers]: the centroid of this cluster
+        _sum [numpy array of float]: the per-dimension sum of this cluster's points
+        _weight [float]: the total weight of this cluster's points
+        _members [set of int]: the same indices as _indices, for fast lookup
+        _cache [dict]: the derived statistics computed since the points last changed,
+                       with the keys 'array', 'bounds' and 'radius' (all optional)
     EXTRA INVARIANTS:
         len(_centroid) == _dataset.getDimension()
         0 <= _indices[i] < _dataset.getSize(), for all 0 <= i < len(_indices)
+        _sum[j] is the sum of the j-th coordinates of the points in _indices, each times
+        its weight in the dataset, and _weight is the sum of those weights
+        _members == set(_indices), and _indices has no duplicates
     """
 
     # Part A
@@ -55,12 +74,17 @@ class Cluster(object):
         assert isinstance(dset, a6dataset.Dataset)
         self._dataset= dset
         self._indices= []
+        self._members= set()
         result=[]
         for apoint in centroid:
             result.append(apoint)
         self._centroid= result
+        self._sum= numpy.zeros(self._dataset.getDimension())
+        self._weight= 0.0
+        self._cache= {}
         if self._centroid != []:
-            assert a6checks.is_point(centroid) and len(centroid)==self._dataset.getDimension()
+            assert a6checks.is_trusted() or (a6checks.is_point(centroid) and
+                                             len(centroid)==self._dataset.getDimension())
         if self._indices != []:
             assert 0 <= min(self.indices) and max(self._indices) <= self._dataset.getSize()
 
@@ -76,6 +100,20 @@ class Cluster(object):
         return output
 
 
+    def setCentroid(self, centroid):
+        """
+        Sets the centroid of this cluster to a copy of centroid.
+
+        This leaves the points in the cluster unchanged.
+
+        Parameter centroid: the new cluster centroid
+        Precondition: centroid is a list of _dataset.getDimension() numbers
+        """
+        assert a6checks.is_trusted() or (a6checks.is_point(centroid) and
+                                         len(centroid)==self._dataset.getDimension())
+        self._centroid= list(centroid)
+
+
     def getIndices(self):
         """
         Returns the indices of points in this cluster
@@ -94,13 +132,86 @@ class Cluster(object):
         Adds the given dataset index to this cluster.
 
         If the index is already in this cluster, this method leaves the
-        cluster unchanged.
+        cluster unchanged.  The check takes constant time.
 
         Precondition: index is a valid index into this cluster's dataset.
         That is, index is an int in the range 0.._dataset.getSize()-1.
         """
-        if self.getIndices().count(index)==0:
+        if not index in self._members:
             self._indices.append(index)
+            self._members.add(index)
+            weight = self._dataset.getWeight(index)
+            self._sum += weight*self._dataset.getPointView(index)
+            self._weight += weight
+            self._cache = {}
+
+
+    def addIndices(self, indices, total=None):
+        """
+        Adds the given dataset indices to this cluster, in order.
+
+        This has the same effect as calling addIndex on each index, but the points are
+        added to the running sum in one numpy operation.  Indices that are already in
+        this cluster (or repeated in indices) are skipped.
+
+        If the caller has already summed the points (for example while labeling them),
+        it can pass that sum as total to save the work.  In that case none of the
+        indices may be in the cluster or repeated.  In a weighted dataset, total must
+        be the weighted sum.
+
+        Precondition: indices is a list of valid indices into this cluster's dataset.
+
+        Parameter total: the per-dimension (weighted) sum of the points at indices (OPTIONAL)
+        Precondition: total is None or a numpy array of _dataset.getDimension() numbers,
+        and if it is not None, indices has no repeats and no index in this cluster
+        """
+        fresh = set(indices)
+        if len(fresh) == len(indices) and self._members.isdisjoint(fresh):
+            # The common case (as in a partition) needs no loop in Python
+            added = list(indices)
+            self._members |= fresh
+        else:
+            added = []
+            for index in indices:
+                if not index in self._members:
+                    self._members.add(index)
+                    added.append(index)
+        if added:
+            self._indices.extend(added)
+            self._cache = {}
+            if self._dataset.isWeighted():
+                weights = self._dataset.getWeights()[added]
+                self._weight += float(weights.sum())
+            else:
+                weights = None
+                self._weight += len(added)
+            if total is None:
+                points = self._dataset.getArray()[added]
+                if weights is not None:
+                    points = points*weights[:, numpy.newaxis]
+                # Accumulate in float64, even if the dataset is float32
+                self._sum += points.sum(axis=0, dtype=numpy.float64)
+            else:
+                assert len(added) == len(indices), 'total does not match the new indices'
+                self._sum += total
+
+
+    def removeIndex(self, index):
+        """
+        Removes the given dataset index from this cluster.
+
+        If the index is not in this cluster, this method leaves the cluster unchanged.
+
+        Precondition: index is a valid index into this cluster's dataset.
+        That is, index is an int in the range 0.._dataset.getSize()-1.
+        """
+        if index in self._members:
+            self._indices.remove(index)
+            self._members.remove(index)
+            weight = self._dataset.getWeight(index)
+            self._sum -= weight*self._dataset.getPointView(index)
+            self._weight -= weight
+            self._cache = {}
 
 
     def clear(self):
@@ -108,6 +219,10 @@ class Cluster(object):
         Removes all points from this cluster, but leave the centroid unchanged.
         """
         self._indices=[]
+        self._members=set()
+        self._sum=numpy.zeros(self._dataset.getDimension())
+        self._weight=0.0
+        self._cache={}
 
 
     def getContents(self):
@@ -117,40 +232,101 @@ class Cluster(object):
         The result is a list of list of numbers.  It has to be computed from the indices.
         """
         # BEGIN REMOVE
+        if self._dataset.getStorage() != 'list':
+            return self.getArray().tolist()
         result = []
         for i in self._indices:
             result.append(self._dataset.getPoint(i))
         return result
         # END REMOVE
 
+    def getCount(self):
+        """
+        Returns the number of points in this cluster.
+        """
+        return len(self._indices)
+
+    def getWeight(self):
+        """
+        Returns the total weight of the points in this cluster.
+
+        This is the same as getCount() if the dataset is not weighted.
+        """
+        return self._weight
+
+    def getArray(self):
+        """
+        Returns the points in this cluster as a read-only getCount() x d numpy array.
+
+        The rows are in the order of getIndices().  The array is cached until the points
+        of this cluster change, so asking for it again does not copy anything.
+        """
+        if not 'array' in self._cache:
+            if self._dataset.getStorage() != 'list':
+                result = self._dataset.getArray()[self._indices]
+            else:
+                result = numpy.array([self._dataset.getPoint(i) for i in self._indices],
+                                     dtype=self._dataset.getPrecision())
+            result = result.reshape(-1, self._dataset.getDimension())
+            result.flags.writeable = False
+            self._cache['array'] = result
+        return self._cache['array']
+
+    def getBounds(self):
+        """
+        Returns a pair (lower, upper) of the smallest and largest coordinates in this
+        cluster, or None if the cluster is empty.
+
+        lower and upper are lists of numbers, with one number per dimension.  The result
+        is cached until the points of this cluster change.
+        """
+        if not self._indices:
+            return None
+        if not 'bounds' in self._cache:
+            points = self.getArray()
+            self._cache['bounds'] = (points.min(axis=0).tolist(), points.max(axis=0).tolist())
+        lower, upper = self._cache['bounds']
+        return (list(lower), list(upper))
+
 
     # Part B
-    def distance(self, point):
+    def distance(self, point, metric=None):
         """
         Returns the euclidean distance from point to this cluster's centroid.
 
+        If a metric is given, this is the distance for that metric instead.
+
         Parameter point: The point to be measured
-        Precondition: point is a list of numbers (int or float), with the same dimension
-        as the centroid.
+        Precondition: point is a list of numbers (int or float), or a 1d numpy array, with
+        the same dimension as the centroid.
+
+        Parameter metric: The distance measure (OPTIONAL)
+        Precondition: metric is None or an a6metric.Metric
         """
-        assert a6checks.is_point(point) and len(point)==len(self._centroid)
-        return numpy.sqrt(sum([(b-a)*(b-a) for a,b in zip(point, self._centroid)]))
+        assert a6checks.is_trusted() or a6checks.is_point_vector(point, len(self._centroid))
+        if metric is not None:
+            return metric.distance(point, self._centroid)
+        diff = numpy.asarray(point, dtype=numpy.float64)-self._centroid
+        return numpy.sqrt(numpy.dot(diff, diff))
 
 
     def getRadius(self):
         """
         Returns the maximum distance from any point in this cluster, to the centroid.
 
-        This method loops over the contents to find the maximum distance from
-        the centroid.  If there are no points in this cluster, it returns 0.
+        The distances are computed in one numpy operation on getArray().  If there are
+        no points in this cluster, it returns 0.  The result is cached until the points
+        or the centroid of this cluster change.
         """
-        result=[]
-        if self._indices != []:
-            for apoint in self.getContents():
-                result.append(self.distance(apoint))
-            return max(result)
-        else:
+        if self._indices == []:
             return 0
+        cached = self._cache.get('radius')
+        if cached is None or cached[0] != self._centroid:
+            diff = self.getArray()-numpy.array(self._centroid, dtype=numpy.float64)
+            radius = float(numpy.sqrt((diff*diff).sum(axis=1).max()))
+            cached = (list(self._centroid), radius)
+            self._cache['radius'] = cached
+        return cached[1]
 
 
     def update(self):
@@ -165,15 +341,20 @@ class Cluster(object):
         numpy.allclose.  The return value should be interpreted as an indication of whether
         the starting centroid was a "stable" position or not.
 
-        If there are no points in the cluster, the centroid. does not change.
+        If there are no points in the cluster, the centroid. does not change.  If the
+        dataset is weighted, the new centroid is the weighted average of the points, and
+        it does not change if their total weight is 0.
+
+        The new centroid is computed from the running sum of the points, so this takes
+        time proportional to the dimension, not to the number of points.
         """
-        if self.getIndices() == []:
+        if self._indices == [] or self._weight <= 0:
             return True
         else:
-            result = sum([ numpy.array(apoint) for apoint in self.getContents()])/ len(self.getContents())
+            result = self._sum / self._weight
             temp= self.getCentroid()
             self._centroid= result.tolist()
-        if (temp== self.getCentroid()):
+        if (temp== self._centroid):
             return True
         else:
             return False
@@ -24,21 +24,62 @@ class Dataset(object):
     The data is stored as a list of list of numbers (ints or floats).  Each component
     list is a data point.
 
+    Alternatively, a dataset may use 'array' storage.  Then the data is stored as one
+    contiguous numpy array of floats, with one row per point.  The array has spare
+    rows at the end so that adding points does not have to reallocate it every time.
+    In this mode getPointView() and getArray() hand out read-only views of the data
+    without copying anything.
+
+    Finally, 'mmap' storage works like 'array' storage, except that the array is given
+    to the dataset and is not copied.  This is meant for a numpy.memmap of a file (see
+    open_file), so that the points stay on disk and the operating system pages them
+    in as they are used.  That way, a dataset can be larger than memory.  Adding a
+    point to such a dataset first moves it into memory, as 'array' storage.
+
+    In any storage, a dataset may also give each point a weight.  A point of weight w
+    counts as w copies of that point in the clustering (see Cluster.update).  Weights
+    are how a small summary of a large dataset, like a coreset, stands in for it.  A
+    dataset without weights acts as if every point had weight 1.
+
+    The numpy arrays of a dataset hold float64 by default.  A dataset may instead use
+    'float32' precision, which halves the memory of the points and the bandwidth of
+    every pass over them.  The distances are then computed in float32, but the sums
+    that the centroids are computed from are still accumulated in float64.
+
     INSTANCE ATTRIBUTES:
         _dimension: the point dimension for this dataset
                     [int > 0. Value never changes after initialization]
         _contents:  the dataset contents
-                    [a list of lists of numbers (float or int), possibly empty.
+                    [a list of lists of numbers (float or int), possibly empty, OR
+                     a 2d numpy array of _precision in 'array' storage, OR
+                     a 2d numpy array (usually a numpy.memmap) in 'mmap' storage]
+        _storage:   the storage mode of this dataset
+                    [one of the strings in STORAGE_MODES]
+        _precision: the type of the numbers in the numpy arrays of this dataset
+                    [one of the strings in PRECISIONS]
+        _size:      the number of points in the dataset
+                    [int >= 0, only used in 'array' and 'mmap' storage]
+        _weights:   the weight of each point, or None if the points are not weighted
+                    [None or a 1d numpy array of float64 >= 0]
     EXTRA INVARIANTS:
         The number of columns in _contents is equal to _dimension.  That is, for every
         item _contents[i] in the list _contents, len(_contents[i]) == dimension.
+        In 'array' and 'mmap' storage, only the first _size rows of _contents are
+        points.
+        If _weights is not None, its first getSize() values are the weights of the
+        points (the rest is room to grow).
 
     None of the attributes should be accessed directly outside of the class Dataset
     (e.g. in the methods of class Cluster or KMeans). Instead, this class has getter and
     setter style methods (with the appropriate preconditions) for modifying these values.
     """
+    # The supported values for the storage parameter
+    STORAGE_MODES = ('list', 'array', 'mmap')
+    # The supported values for the precision parameter
+    PRECISIONS = ('float64', 'float32')
 
-    def __init__(self, dim, contents=None):
+    def __init__(self, dim, contents=None, storage='list', weights=None,
+                 precision='float64'):
         """
         Initializes a database for the given point dimension.
 
@@ -53,14 +94,57 @@ class Dataset(object):
         Parameter contents: the dataset contents
         Precondition: contents is either None or it is a table of numbers (int or float).
         If contents is not None, then contents if not empty and the number of columns is
-        equal to dim.
+        equal to dim.  In 'array' storage, contents may also be a 2d numpy array.  In
+        'mmap' storage, contents must be a 2d numpy array, and it is NOT copied.
+
+        Parameter storage: the storage mode (OPTIONAL)
+        Precondition: storage is one of the strings in STORAGE_MODES
+
+        Parameter weights: the weight of each point in contents (OPTIONAL)
+        Precondition: weights is None, or a list or 1d numpy array of numbers >= 0 with
+        one weight per point.  It is copied.
+
+        Parameter precision: the type of the numbers in the arrays (OPTIONAL)
+        Precondition: precision is one of the strings in PRECISIONS.  It is ignored in
+        'mmap' storage, where the precision is 'float32' if contents is an array of
+        float32, and 'float64' otherwise.
         """
+        assert storage in self.STORAGE_MODES, repr(storage)+' is not a storage mode'
+        assert precision in self.PRECISIONS, repr(precision)+' is not a precision'
         self._dimension= dim
-        self._contents= []
-        if (contents != None):
-            for alist in contents:
-                self._contents.append(alist)
-        assert a6checks.is_point_list(self._contents)
+        self._storage= storage
+        self._precision= precision
+        if storage == 'mmap':
+            assert a6checks.is_point_array(contents, dim)
+            self._precision= 'float32' if contents.dtype == numpy.float32 else 'float64'
+            self._contents= contents
+            self._size= len(contents)
+        elif storage == 'array':
+            if contents is None:
+                contents = []
+            if isinstance(contents, numpy.ndarray):
+                assert a6checks.is_point_array(contents, dim)
+            else:
+                assert a6checks.is_trusted() or a6checks.is_point_list(contents)
+            table = numpy.array(contents, dtype=precision)
+            if len(table) == 0:
+                table = table.reshape(0, dim)
+            # Even trusted tables must have dim columns, or the rows would be regrouped
+            assert a6checks.is_point_array(table, dim), 'contents do not have %d columns' % dim
+            self._contents= numpy.ascontiguousarray(table)
+            self._size= len(table)
+        else:
+            self._contents= []
+            if (contents is not None):
+                for alist in contents:
+                    self._contents.append(alist)
+            assert a6checks.is_trusted() or a6checks.is_point_list(self._contents)
+
+        self._weights= None
+        if weights is not None:
+            weights = numpy.array(weights, dtype=numpy.float64)
+            assert a6checks.is_weight_array(weights, self.getSize()), 'weights are not valid'
+            self._weights= weights
 
 
     def getDimension(self):
@@ -73,8 +157,56 @@ class Dataset(object):
         """
         Returns the number of elements in this data set.
         """
+        if self._storage != 'list':
+            return self._size
         return len(self._contents)
 
+    def getStorage(self):
+        """
+        Returns the storage mode of this data set, one of STORAGE_MODES
+        """
+        return self._storage
+
+    def getPrecision(self):
+        """
+        Returns the type of the numbers in the arrays of this data set, one of PRECISIONS
+        """
+        return self._precision
+
+    def isWeighted(self):
+        """
+        Returns True if the points of this data set have weights; False otherwise.
+        """
+        return self._weights is not None
+
+    def getWeight(self, i):
+        """
+        Returns the weight of the point at index i in this data set.
+
+        This is 1.0 if the data set is not weighted.
+
+        Parameter i: the index position of the point
+        Precondition: i is an int that refers to a valid position in 0..getSize()-1
+        """
+        if self._weights is None:
+            return 1.0
+        return float(self._weights[:self.getSize()][i])
+
+    def getWeights(self):
+        """
+        Returns the weights of the points in this data set as a read-only numpy array.
+
+        The array has getSize() values.  If the data set is weighted, this does not copy
+        the weights; the result is a view, which is not resized by a later addPoint.
+        Otherwise, the result is a new array of ones.
+        """
+        if self._weights is None:
+            result = numpy.ones(self.getSize())
+        else:
+            result = self._weights[:self.getSize()]
+        result.flags.writeable = False
+        return result
+
     def getContents(self):
         """
         Returns the contents of this data set as a list.
@@ -83,6 +215,8 @@ class Dataset(object):
         list will modify the data set.  If you want to access the data set, but want to
         protect yourself from modifying the data, use getPoint() instead.
         """
+        if self._storage != 'list':
+            return self._contents[:self._size].tolist()
         output=[]
         for i in range(len(self._contents)):
             output.append(self.getPoint(i))
@@ -106,20 +240,173 @@ class Dataset(object):
         Parameter i: the index position of the point
         Precondition: i is an int that refers to a valid position in 0..getSize()-1
         """
+        if self._storage != 'list':
+            return self._contents[:self._size][i].tolist()
         output=[]
         for apoint in self._contents[i]:
             output.append(apoint)
         return output
 
-    def addPoint(self,point):
+    def getPointView(self, i):
+        """
+        Returns a read-only numpy view of the point at index i in this data set.
+
+        In 'array' storage this does not copy the point; the result shares memory with
+        the data set.  In 'list' storage the result is a new array.
+
+        Parameter i: the index position of the point
+        Precondition: i is an int that refers to a valid position in 0..getSize()-1
+        """
+        if self._storage != 'list':
+            return self.getArray()[i]
+        result = numpy.array(self._contents[i], dtype=self._precision)
+        result.flags.writeable = False
+        return result
+
+    def getArray(self):
+        """
+        Returns the contents of this data set as a read-only getSize() x getDimension()
+        numpy array.
+
+        In 'array' storage this does not copy the data; the result is a view of the
+        data set.  The view is not resized by a later addPoint, so ask for a new one
+        after adding points.  In 'list' storage the result is a new array.
+        """
+        if self._storage != 'list':
+            result = self._contents[:self._size]
+        else:
+            result = numpy.array(self._contents, dtype=self._precision)
+            result = result.reshape(-1, self._dimension)
+        result.flags.writeable = False
+        return result
+
+    def addPoint(self,point,weight=None):
         """
         Adds a COPY of point at the end of _contents.
 
         This method does not add the point directly. It adds a copy of the point.
 
-        Precondition: point is a list of numbers (int or float),  len(point) = _dimension."""
-        assert a6checks.is_point(point) and len(point)==self._dimension
+        Precondition: point is a list of numbers (int or float),  len(point) = _dimension.
+
+        Parameter weight: the weight of the point (OPTIONAL)
+        Precondition: weight is None (meaning 1) or a number >= 0"""
+        assert a6checks.is_trusted() or (a6checks.is_point(point) and
+                                         len(point)==self._dimension)
+        if weight is not None:
+            self._addWeights(numpy.array([weight], dtype=numpy.float64))
+        elif self._weights is not None:
+            self._addWeights(numpy.ones(1))
+        if self._storage != 'list':
+            self._reserve(self._size+1)
+            self._contents[self._size] = point
+            self._size += 1
+            return
         apoint=[]
         for value in point:
             apoint.append(value)
         self._contents.append(apoint)
+
+    def addPoints(self, table, weights=None):
+        """
+        Adds COPIES of the points in table at the end of _contents.
+
+        This has the same effect as calling addPoint on each row of table, but it is
+        much faster for many points.  The table is checked once, in a vectorized pass:
+        it must convert to a 2d numpy array of numbers with _dimension columns.  In
+        'array' storage the rows are then copied into the array in one operation (and
+        the array grows geometrically, as with addPoint).
+
+        Parameter table: the points to add
+        Precondition: table is a 2d numpy array or a table of numbers (int or float),
+        with _dimension columns
+
+        Parameter weights: the weights of the points (OPTIONAL)
+        Precondition: weights is None (meaning all 1), or a list or 1d numpy array of
+        numbers >= 0 with one weight per row of table
+        """
+        if isinstance(table, numpy.ndarray):
+            array = table
+        elif len(table) == 0:
+            array = numpy.zeros((0, self._dimension))
+        else:
+            try:
+                array = numpy.array(table)
+            except ValueError:
+                # Rows of different lengths
+                array = None
+        assert a6checks.is_point_array(array, self._dimension), 'table is not a point table'
+        if weights is not None:
+            self._addWeights(numpy.array(weights, dtype=numpy.float64), len(array))
+        elif self._weights is not None:
+            self._addWeights(numpy.ones(len(array)))
+        if self._storage != 'list':
+            self._reserve(self._size+len(array))
+            self._contents[self._size:self._size+len(array)] = array
+            self._size += len(array)
+        elif isinstance(table, numpy.ndarray):
+            self._contents.extend(array.tolist())
+        else:
+            for point in table:
+                self._contents.append(list(point))
+
+    def _addWeights(self, weights, count=None):
+        """
+        Stores the weights of points about to be added at the end of this data set.
+
+        If the data set is not weighted yet, the points already in it get weight 1.  The
+        weight array grows geometrically, like the 'array' storage.  Call this BEFORE
+        adding the points, as it puts the weights after the current getSize() points.
+
+        Parameter weights: the new weights
+        Precondition: weights is a 1d numpy array of float64
+
+        Parameter count: the number of points about to be added (OPTIONAL)
+        Precondition: count is None (meaning len(weights)) or an int >= 0
+        """
+        size  = self.getSize()
+        count = len(weights) if count is None else count
+        assert a6checks.is_weight_array(weights, count), 'weights are not valid'
+        if self._weights is None:
+            self._weights = numpy.ones(size)
+        if size+count > len(self._weights):
+            grown = numpy.empty(max(size+count, 2*len(self._weights), 16))
+            grown[:size] = self._weights[:size]
+            self._weights = grown
+        self._weights[size:size+count] = weights
+
+    def _reserve(self, size):
+        """
+        Makes sure the array storage has room for at least size points.
+
+        The capacity grows geometrically, so that adding n points one at a time costs
+        amortized O(n) copies.
+
+        In 'mmap' storage, this moves the points into memory, as 'array' storage.
+
+        Parameter size: the number of points to make room for
+        Precondition: size is an int >= 0 and the storage is 'array' or 'mmap'
+        """
+        capacity = len(self._contents)
+        if size <= capacity and self._storage == 'array':
+            return
+        capacity = max(size, 2*capacity, 16)
+        grown = numpy.empty((capacity, self._dimension), dtype=self._precision)
+        grown[:self._size] = self._contents[:self._size]
+        self._contents = grown
+        self._storage = 'array'
+
+
+def open_file(filename):
+    """
+    Returns a Dataset in 'mmap' storage for the given .npy file.
+
+    The file is mapped read-only, so opening it reads nothing but its header, and the
+    file may be larger than memory.
+
+    Parameter filename: The file to open
+    Precondition: filename is the name of a .npy file holding a 2d array of numbers
+    with at least one column
+    """
+    contents = numpy.load(filename, mmap_mode='r')
+    assert contents.ndim == 2, repr(filename)+' is not a 2d array'
+    return Dataset(contents.shape[1], contents, 'mmap')
@@ -0,0 +1,402 @@
+"""
+Distance metrics for k-Means clustering
+
+This file contains the metrics that the Algorithm class can cluster with.  Each metric
+measures many points against many centroids in one numpy operation, and knows how to
+compute the best centroid of a group of points for its measure (the mean for euclidean
+distance, the median for manhattan distance, and so on).
+
+Euclidean distance is the default, and the only metric supported by the 'hamerly' and
+'kdtree' engines, as they rely on the geometry of euclidean space.
+
+The kernels compute in float32 when the points are float32 (see the precision of a
+Dataset), and in float64 otherwise.  The centroids are converted to the same type, so
+that no float64 temporaries are made from float32 points.
+"""
+import numpy
+
+
+# The metric names accepted by get_metric
+METRICS = ('euclidean', 'sqeuclidean', 'manhattan', 'cosine', 'mahalanobis')
+
+# The metrics whose centers are means (see Metric.MEAN), which mini-batch steps need
+MEAN_METRICS = ('euclidean', 'sqeuclidean', 'mahalanobis')
+
+
+def compute_type(points):
+    """
+    Returns the numpy type that distances to points are computed in.
+
+    This is numpy.float32 if points is an array of float32, and numpy.float64 otherwise.
+
+    Parameter points: The points
+    Precondition: points is a numpy array
+    """
+    return numpy.float32 if points.dtype == numpy.float32 else numpy.float64
+
+
+def rounding(points):
+    """
+    Returns a bound on the relative rounding error of square_distances for points.
+
+    Code that skips distance computations by comparing bounds pads them by this much,
+    so that it never skips a centroid that square_distances would find nearer.
+
+    Parameter points: The points
+    Precondition: points is a 2d numpy array
+    """
+    return 4*(points.shape[1]+2)*float(numpy.finfo(compute_type(points)).eps)
+
+
+def square_distances(points, centroids):
+    """
+    Returns the n x k numpy array of squared euclidean distances from points to centroids.
+
+    Every engine computes euclidean distances with this function, so that they all
+    agree on which centroid is nearest, down to the last bit.
+
+    Parameter points: The points to measure
+    Precondition: points is a 2d numpy array of numbers
+
+    Parameter centroids: The centroids to compare against
+    Precondition: centroids is a non-empty 2d numpy array with the same number of
+    columns as points
+    """
+    centroids = centroids.astype(compute_type(points), copy=False)
+    diff = points[:, numpy.newaxis, :] - centroids[numpy.newaxis, :, :]
+    return (diff*diff).sum(axis=2)
+
+
+def weighted_median(points, weights=None):
+    """
+    Returns the per-dimension (weighted) median of points as a 1d numpy array.
+
+    Without weights, this is numpy.median.  With weights, the median of a column is the
+    smallest value such that the values up to it hold at least half of the weight.
+
+    Parameter points: The points
+    Precondition: points is a non-empty 2d numpy array of numbers
+
+    Parameter weights: The weight of each point (OPTIONAL)
+    Precondition: weights is None or a 1d numpy array of numbers >= 0, one per point,
+    with a positive sum
+    """
+    if weights is None:
+        return numpy.median(points, axis=0)
+    order = numpy.argsort(points, axis=0, kind='stable')
+    cumulative = numpy.cumsum(weights[order], axis=0)
+    half = cumulative[-1]/2
+    result = numpy.zeros(points.shape[1])
+    for col in range(points.shape[1]):
+        pos = numpy.searchsorted(cumulative[:, col], half[col])
+        result[col] = points[order[pos, col], col]
+    return result
+
+
+class Metric(object):
+    """
+    A class representing a distance measure for k-means clustering.
+
+    The cost of a point for a centroid is what k-means minimizes: the algorithm assigns
+    each point to the centroid of least cost, and the inertia of a clustering is the
+    total cost of its points.  The cost only has to be ordered like the distance, so
+    it avoids square roots (for example, it is the SQUARED euclidean distance).
+
+    This base class is squared euclidean distance, where the cost is the distance.
+    Subclasses override cost, distances and center.
+
+    CLASS ATTRIBUTES:
+        NAME [str]: the name of the metric, one of METRICS
+        MEAN [bool]: True if center is the (weighted) mean of the points, so that the
+                     centroids can be updated from running sums
+    """
+    NAME = 'sqeuclidean'
+    MEAN = True
+
+    def cost(self, points, centroids):
+        """
+        Returns the n x k numpy array of costs of points for centroids.
+
+        Parameter points: The points to measure
+        Precondition: points is a 2d numpy array of numbers
+
+        Parameter centroids: The centroids to compare against
+        Precondition: centroids is a non-empty 2d numpy array with the same number of
+        columns as points
+        """
+        return square_distances(points, centroids)
+
+    def distances(self, points, centroids):
+        """
+        Returns the n x k numpy array of distances from points to centroids.
+
+        This is the cost, unless the cost is a squared distance.
+
+        Parameter points: The points to measure
+        Precondition: points is a 2d numpy array of numbers
+
+        Parameter centroids: The centroids to compare against
+        Precondition: centroids is a non-empty 2d numpy array with the same number of
+        columns as points
+        """
+        return self.cost(points, centroids)
+
+    def distance(self, point, centroid):
+        """
+        Returns the distance from point to centroid as a float.
+
+        Parameter point: The point to measure
+        Precondition: point is a list or 1d numpy array of numbers
+
+        Parameter centroid: The centroid to measure against
+        Precondition: centroid is a list or 1d numpy array of numbers of the same length
+        """
+        points = numpy.array([point], dtype=numpy.float64)
+        return float(self.distances(points, numpy.array([centroid], dtype=numpy.float64))[0, 0])
+
+    def center(self, points, weights=None):
+        """
+        Returns the centroid of least total cost for points, as a 1d numpy array.
+
+        Parameter points: The points
+        Precondition: points is a non-empty 2d numpy array of numbers
+
+        Parameter weights: The weight of each point (OPTIONAL)
+        Precondition: weights is None or a 1d numpy array of numbers >= 0, one per point,
+        with a positive sum
+        """
+        if weights is None:
+            return points.mean(axis=0)
+        return (points*weights[:, numpy.newaxis]).sum(axis=0)/weights.sum()
+
+
+class Euclidean(Metric):
+    """
+    Euclidean distance, the default metric.
+
+    The cost is the squared distance, so k-means minimizes the within-cluster sum of
+    squares, and the centroids are means.
+    """
+    NAME = 'euclidean'
+
+    def distances(self, points, centroids):
+        """
+        Returns the n x k numpy array of euclidean distances from points to centroids.
+
+        Parameter points: The points to measure
+        Precondition: points is a 2d numpy array of numbers
+
+        Parameter centroids: The centroids to compare against
+        Precondition: centroids is a non-empty 2d numpy array with the same number of
+        columns as points
+        """
+        return numpy.sqrt(self.cost(points, centroids))
+
+
+class Manhattan(Metric):
+    """
+    Manhattan (city block) distance, the sum of the absolute coordinate differences.
+
+    The centroid of least total distance is the per-dimension median, so clustering
+    with this metric is k-medians.  It is less sensitive to outliers than k-means.
+    """
+    NAME = 'manhattan'
+    MEAN = False
+
+    def cost(self, points, centroids):
+        """
+        Returns the n x k numpy array of manhattan distances from points to centroids.
+
+        Parameter points: The points to measure
+        Precondition: points is a 2d numpy array of numbers
+
+        Parameter centroids: The centroids to compare against
+        Precondition: centroids is a non-empty 2d numpy array with the same number of
+        columns as points
+        """
+        centroids = centroids.astype(compute_type(points), copy=False)
+        diff = points[:, numpy.newaxis, :] - centroids[numpy.newaxis, :, :]
+        return numpy.abs(diff).sum(axis=2)
+
+    def center(self, points, weights=None):
+        """
+        Returns the per-dimension (weighted) median of points.
+
+        Parameter points: The points
+        Precondition: points is a non-empty 2d numpy array of numbers
+
+        Parameter weights: The weight of each point (OPTIONAL)
+        Precondition: weights is None or a 1d numpy array of numbers >= 0, one per point,
+        with a positive sum
+        """
+        return weighted_median(points, weights)
+
+
+class Cosine(Metric):
+    """
+    Cosine distance, which is 1 minus the cosine of the angle between two vectors.
+
+    Only the direction of a point matters, not its length.  The centroid of a group is
+    the unit vector in the direction of the mean of their unit vectors, as in spherical
+    k-means.  A zero vector has cosine 0 with everything, so its distance is always 1.
+    """
+    NAME = 'cosine'
+    MEAN = False
+
+    def cost(self, points, centroids):
+        """
+        Returns the n x k numpy array of cosine distances from points to centroids.
+
+        Parameter points: The points to measure
+        Precondition: points is a 2d numpy array of numbers
+
+        Parameter centroids: The centroids to compare against
+        Precondition: centroids is a non-empty 2d numpy array with the same number of
+        columns as points
+        """
+        return 1.0-numpy.dot(_unit(points), _unit(centroids).T)
+
+    def center(self, points, weights=None):
+        """
+        Returns the unit vector in the direction of the (weighted) mean of the unit
+        vectors of points.
+
+        If those unit vectors cancel out, this returns the zero vector.
+
+        Parameter points: The points
+        Precondition: points is a non-empty 2d numpy array of numbers
+
+        Parameter weights: The weight of each point (OPTIONAL)
+        Precondition: weights is None or a 1d numpy array of numbers >= 0, one per point,
+        with a positive sum
+        """
+        return _unit(Metric.center(self, _unit(points), weights)[numpy.newaxis, :])[0]
+
+
+class Mahalanobis(Metric):
+    """
+    Mahalanobis distance, which measures differences relative to the spread of the data.
+
+    The distance between x and y is sqrt((x-y) P (x-y)^T), where P is the inverse of
+    the covariance matrix of the data.  Correlated or large-scale features then do not
+    dominate the clustering.  The cost is the squared distance, and the centroids are
+    means, as with euclidean distance.
+
+    INSTANCE ATTRIBUTES:
+        _transform [numpy array]: a d x d matrix W with W W^T = P, so that the distance
+                                  is the euclidean distance between x W and y W
+    """
+    NAME = 'mahalanobis'
+
+    def __init__(self, covariance):
+        """
+        Initializes the metric for the given covariance matrix.
+
+        A singular covariance matrix (such as that of a constant feature) is inverted
+        with the pseudo-inverse, so that feature is ignored.
+
+        Parameter covariance: the covariance matrix of the data
+        Precondition: covariance is a symmetric d x d numpy array of numbers
+        """
+        values, vectors = numpy.linalg.eigh(numpy.linalg.pinv(covariance, hermitian=True))
+        self._transform = vectors*numpy.sqrt(numpy.maximum(values, 0))
+
+    def cost(self, points, centroids):
+        """
+        Returns the n x k numpy array of squared mahalanobis distances.
+
+        Parameter points: The points to measure
+        Precondition: points is a 2d numpy array of numbers
+
+        Parameter centroids: The centroids to compare against
+        Precondition: centroids is a non-empty 2d numpy array with the same number of
+        columns as points
+        """
+        return square_distances(numpy.dot(points, self._transform),
+                                numpy.dot(centroids, self._transform))
+
+    def distances(self, points, centroids):
+        """
+        Returns the n x k numpy array of mahalanobis distances.
+
+        Parameter points: The points to measure
+        Precondition: points is a 2d numpy array of numbers
+
+        Parameter centroids: The centroids to compare against
+        Precondition: centroids is a non-empty 2d numpy array with the same number of
+        columns as points
+        """
+        return numpy.sqrt(self.cost(points, centroids))
+
+
+def _unit(points):
+    """
+    Returns a copy of points where every nonzero row is scaled to length 1.
+
+    Parameter points: The points
+    Precondition: points is a 2d numpy array of numbers
+    """
+    norms = numpy.sqrt((points*points).sum(axis=1))[:, numpy.newaxis]
+    return numpy.divide(points, norms, out=numpy.zeros(points.shape), where=norms > 0)
+
+
+def covariance(points, weights=None, rows=1 << 16):
+    """
+    Returns the (weighted) covariance matrix of points as a d x d numpy array.
+
+    The points are read a block of rows at a time, so this works well on a numpy.memmap
+    that does not fit in memory.
+
+    Parameter points: The points
+    Precondition: points is a non-empty 2d numpy array of numbers
+
+    Parameter weights: The weight of each point (OPTIONAL)
+    Precondition: weights is None or a 1d numpy array of numbers >= 0, one per point,
+    with a positive sum
+
+    Parameter rows: The number of rows read at once (OPTIONAL)
+    Precondition: rows is an int > 0
+    """
+    if weights is None:
+        weights = numpy.ones(len(points))
+    total = weights.sum()
+    mean  = numpy.zeros(points.shape[1])
+    for start in range(0, len(points), rows):
+        mean += numpy.dot(weights[start:start+rows], points[start:start+rows])
+    mean /= total
+    result = numpy.zeros((points.shape[1], points.shape[1]))
+    for start in range(0, len(points), rows):
+        block = points[start:start+rows]-mean
+        result += numpy.dot(block.T*weights[start:start+rows], block)
+    return result/total
+
+
+def get_metric(name, points=None, weights=None):
+    """
+    Returns the Metric with the given name.
+
+    The 'mahalanobis' metric is fit to the covariance of points, so they are required
+    for it (and ignored by the other metrics).
+
+    Parameter name: the name of the metric
+    Precondition: name is one of the strings in METRICS
+
+    Parameter points: the data to cluster (OPTIONAL)
+    Precondition: points is None or a non-empty 2d numpy array of numbers; it is not
+    None for 'mahalanobis'
+
+    Parameter weights: the weight of each point (OPTIONAL)
+    Precondition: weights is None or a 1d numpy array of numbers >= 0, one per point,
+    with a positive sum
+    """
+    assert name in METRICS, repr(name)+' is not a metric'
+    if name == 'euclidean':
+        return Euclidean()
+    elif name == 'sqeuclidean':
+        return Metric()
+    elif name == 'manhattan':
+        return Manhattan()
+    elif name == 'cosine':
+        return Cosine()
+    assert points is not None, 'the mahalanobis metric needs the data'
+    return Mahalanobis(covariance(points, weights))
@@ -10,18 +10,29 @@ Date: October 18, 2018
 """
 import introcs
 import random
+import io
+import json
 import numpy
 import tools
 import os, os.path
+import atexit
+import shutil
+import tempfile
 
 # The modules to test.
 import a6dataset
 import a6cluster
 import a6algorithm
+import a6metric
 
 # Helper function for latter tests
 TEST_FILE = 'data/candy.csv'
 
+# Keep the dataset cache of the tests out of the home directory
+CACHE_DIR = tempfile.mkdtemp(prefix='cluster-test-')
+tools.CACHE_DIR = CACHE_DIR
+atexit.register(shutil.rmtree, CACHE_DIR, True)
+
 
 def assert_point_sets_equal(expected,received):
     """
@@ -75,6 +86,47 @@ def assert_point_sets_equal(expected,received):
 #        return a6.Algorithm(dataset, k, seeds)
 
 
+def test_checks():
+    """
+    Tests the helper functions in a6checks.
+    """
+    import a6checks
+    print('  Testing module a6checks')
+    introcs.assert_true(a6checks.is_point([1, 2.0]))
+    introcs.assert_false(a6checks.is_point([1, '2']))
+    introcs.assert_false(a6checks.is_point((1, 2)))
+    introcs.assert_true(a6checks.is_point_list([[1, 2.0], [3, 4]]))
+    introcs.assert_false(a6checks.is_point_list([[1, 2.0], [3]]))
+
+    introcs.assert_true(a6checks.is_point_array(numpy.zeros((5, 2)), 2))
+    introcs.assert_false(a6checks.is_point_array(numpy.zeros((5, 2)), 3))
+    introcs.assert_false(a6checks.is_point_array(numpy.array([['a', 'b']]), 2))
+    introcs.assert_true(a6checks.is_point_vector(numpy.zeros(3), 3))
+    introcs.assert_true(a6checks.is_point_vector([0, 0.5, 1], 3))
+    introcs.assert_false(a6checks.is_point_vector(numpy.zeros((1, 3)), 3))
+    introcs.assert_true(a6checks.is_finite_array(numpy.ones((2, 2))))
+    introcs.assert_false(a6checks.is_finite_array(numpy.array([[1.0, numpy.nan]])))
+    introcs.assert_false(a6checks.is_finite_array([[1.0, 2.0]]))
+
+    # Trusted mode skips the checks in hot paths, but only there
+    dset = a6dataset.Dataset(3)
+    cluster = a6cluster.Cluster(dset, [0.0, 0.0, 0.0])
+    try:
+        cluster.distance((3.0, 4.0, 0.0))
+        introcs.quit_with_error('Cluster.distance did not check its point')
+    except AssertionError:
+        pass
+    a6checks.set_trusted(True)
+    try:
+        introcs.assert_floats_equal(5.0, float(cluster.distance((3.0, 4.0, 0.0))))
+    finally:
+        a6checks.set_trusted(False)
+    introcs.assert_false(a6checks.is_trusted())
+
+    print('  module a6checks appears correct')
+    print()
+
+
 def test_dataset():
     """
     Tests the Dataset class.
@@ -132,6 +184,135 @@ def test_dataset():
     print()
 
 
+def test_dataset_array():
+    """
+    Tests the 'array' storage of the Dataset class.
+    """
+    print('  Testing array storage of class Dataset')
+
+    dset1 = a6dataset.Dataset(3, storage='array')
+    introcs.assert_equals('array',dset1.getStorage())
+    introcs.assert_equals(0,dset1.getSize())
+    introcs.assert_equals((0,3),dset1.getArray().shape)
+
+    items = [[0.0,0.0,0.0],[1.0,0.0,0.0],[0.0,1.0,0.0],[0.0,0.0,1.0]]
+    dset2 = a6dataset.Dataset(3,items,'array')
+    introcs.assert_equals(4,dset2.getSize())
+    assert_point_sets_equal(items,dset2.getContents())
+    introcs.assert_false(dset2.getContents()[0] is items[0])
+    introcs.assert_float_lists_equal([0.0,1.0,0.0],dset2.getPoint(2))
+    introcs.assert_false(dset2.getPoint(2) is dset2.getPoint(2))
+
+    # Rows of the wrong length are not regrouped, even for trusted data
+    introcs.assert_error(a6dataset.Dataset,2,[[1,2,3],[4,5,6]],'array')
+    import a6checks
+    a6checks.set_trusted(True)
+    try:
+        introcs.assert_error(a6dataset.Dataset,2,[[1,2,3],[4,5,6]],'array')
+    finally:
+        a6checks.set_trusted(False)
+
+    # Views share memory with the dataset and cannot be written
+    view = dset2.getArray()
+    introcs.assert_true(numpy.shares_memory(view,dset2.getPointView(1)))
+    introcs.assert_false(view.flags.writeable)
+    introcs.assert_false(dset2.getPointView(1).flags.writeable)
+
+    print('    Views look okay')
+
+    # Adding many points grows the storage
+    for pos in range(100):
+        dset1.addPoint([pos,0.5,4.2])
+    introcs.assert_equals(100,dset1.getSize())
+    introcs.assert_float_lists_equal([99.0,0.5,4.2],dset1.getPoint(99))
+    introcs.assert_equals((100,3),dset1.getArray().shape)
+    introcs.assert_float_lists_equal([0.0,0.5,4.2],dset1.getContents()[0])
+
+    print('    Method Dataset.addPoint looks okay')
+
+    # Bulk additions, in both storages, from tables and arrays
+    for storage in ['list', 'array']:
+        dset4 = a6dataset.Dataset(2, [[0.0,0.0]], storage)
+        table = [[1,2.5],[3.0,4]]
+        dset4.addPoints(table)
+        dset4.addPoints(numpy.array([[5.0,6.0]]))
+        dset4.addPoints([])
+        introcs.assert_equals(4,dset4.getSize())
+        assert_point_sets_equal([[0.0,0.0],[1.0,2.5],[3.0,4.0],[5.0,6.0]],dset4.getContents())
+        introcs.assert_false(id(table[0]) in map(id,dset4.getContents()))
+        for bad in [[[1.0,2.0,3.0]], [['a','b']], [[1.0],[2.0,3.0]]]:
+            try:
+                dset4.addPoints(bad)
+                introcs.quit_with_error('addPoints accepted '+repr(bad))
+            except AssertionError:
+                pass
+        introcs.assert_equals(4,dset4.getSize())
+
+    print('    Method Dataset.addPoints looks okay')
+
+    # A memory-mapped file is used in place
+    file = os.path.join(tempfile.mkdtemp(dir=CACHE_DIR),'items.npy')
+    numpy.save(file,numpy.array(items))
+    dset3 = a6dataset.open_file(file)
+    introcs.assert_equals('mmap',dset3.getStorage())
+    introcs.assert_equals(3,dset3.getDimension())
+    introcs.assert_equals(4,dset3.getSize())
+    introcs.assert_float_lists_equal([0.0,1.0,0.0],dset3.getPoint(2))
+    assert_point_sets_equal(items,dset3.getContents())
+    km = a6algorithm.Algorithm(dset3, 2, [0, 1])
+    km.run(10)
+    introcs.assert_equals([0,2,3],km.getClusters()[0].getIndices())
+    introcs.assert_float_lists_equal([0.0,1./3,1./3],km.getClusters()[0].getCentroid())
+
+    # Adding a point moves it to memory
+    dset3.addPoint([2.0,2.0,2.0])
+    introcs.assert_equals('array',dset3.getStorage())
+    introcs.assert_equals(5,dset3.getSize())
+    introcs.assert_float_lists_equal([0.0,0.0,1.0],dset3.getPoint(3))
+    introcs.assert_float_lists_equal([2.0,2.0,2.0],dset3.getPoint(4))
+
+    print('    Memory-mapped storage looks okay')
+    print('  array storage of class Dataset appears correct')
+    print()
+
+
+def test_read_dataset():
+    """
+    Tests the function tools.read_dataset.
+    """
+    print('  Testing function tools.read_dataset')
+    file = os.path.join(os.path.split(__file__)[0],TEST_FILE)
+    header, data = tools.read_dataset(file)
+    introcs.assert_equals(['SWEET','SOUR','NUTTY','TEXTURE'],header)
+    introcs.assert_equals((100,4),data.shape)
+    introcs.assert_float_lists_equal([0.32,0.87,0.14,0.68],data[0].tolist())
+    introcs.assert_float_lists_equal([0.36,0.34,0.75,0.37],data[99].tolist())
+    introcs.assert_equals(data.tolist(),tools.data_for_file(file))
+
+    # A file with no COMMENTS column and more rows than a chunk
+    file = os.path.join(os.path.split(__file__)[0],'data','sample1-2d.csv')
+    header, data = tools.read_dataset(file)
+    introcs.assert_equals(['X','Y'],header)
+    introcs.assert_equals((5000,2),data.shape)
+    introcs.assert_float_lists_equal([0.683911535,0.543503673],data[0].tolist())
+
+    # The cache gives the same data, mapped from disk the second time
+    saved = tools.CACHE_DIR
+    try:
+        tools.CACHE_DIR = tempfile.mkdtemp(dir=CACHE_DIR)
+        header1, data1 = tools.load_dataset(file)
+        header2, data2 = tools.load_dataset(file)
+        introcs.assert_equals(['X','Y'],header2)
+        introcs.assert_true(isinstance(data2,numpy.memmap))
+        introcs.assert_true(numpy.array_equal(data,data2))
+        introcs.assert_equals(2,len(os.listdir(tools.CACHE_DIR)))
+    finally:
+        tools.CACHE_DIR = saved
+
+    print('  function tools.read_dataset appears correct')
+    print()
+
+
 def test_cluster_a():
     """
     Tests Part A of the Cluster class assignment.
@@ -231,8 +412,44 @@ def test_cluster_b():
     # TEST CASE 3 (radius)
     rads = cluster3.getRadius()
     introcs.assert_floats_equal(1.1180340,rads)
+
+    # The radius follows changes to the centroid and the points
+    cluster3.setCentroid([0.0,0.0,0.0])
+    introcs.assert_floats_equal(1.0,cluster3.getRadius())
+    cluster3._centroid = [1.0,0.0,0.0]
+    introcs.assert_floats_equal(1.4142136,cluster3.getRadius())
+    cluster3.addIndex(3)
+    introcs.assert_floats_equal(1.4142136,cluster3.getRadius())
+    cluster3.removeIndex(1)
+    cluster3.removeIndex(3)
+    introcs.assert_floats_equal(1.0,cluster3.getRadius())
+    cluster3.clear()
+    introcs.assert_equals(0,cluster3.getRadius())
     print('    Method Cluster.getRadius() looks okay')
 
+    # The derived statistics are cached until the points change
+    introcs.assert_equals(0,cluster3.getCount())
+    introcs.assert_equals(None,cluster3.getBounds())
+    introcs.assert_equals((0,3),cluster3.getArray().shape)
+    cluster3.addIndices([1,3])
+    introcs.assert_equals(2,cluster3.getCount())
+    array = cluster3.getArray()
+    introcs.assert_float_lists_equal([[0.0,1.0,0.0],[0.0,0.0,1.0]],array.tolist())
+    introcs.assert_true(array is cluster3.getArray())
+    introcs.assert_false(array.flags.writeable)
+    introcs.assert_equals(([0.0,0.0,0.0],[0.0,1.0,1.0]),cluster3.getBounds())
+    cluster3.addIndex(0)
+    introcs.assert_false(array is cluster3.getArray())
+    introcs.assert_equals(([0.0,0.0,0.0],[1.0,1.0,1.0]),cluster3.getBounds())
+
+    # In list storage, getContents still copies the points as they were stored
+    ints = a6dataset.Dataset(2, [[1,2],[3,4]])
+    cluster4 = a6cluster.Cluster(ints, [0,0])
+    cluster4.addIndex(1)
+    introcs.assert_equals([[3,4]],cluster4.getContents())
+    introcs.assert_true(type(cluster4.getContents()[0][0]) == int)
+    print('    Method Cluster.getArray() looks okay')
+
     # TEST CASE 1 (updateCentroid): centroid remains the same
     stable = cluster2.update()
     introcs.assert_float_lists_equal([0.5, 0.5, 0.0], cluster2.getCentroid())
@@ -249,6 +466,20 @@ def test_cluster_b():
     introcs.assert_float_lists_equal([0.25, 0.25, 0.25], cluster2.getCentroid())
     introcs.assert_true(stable)
 
+    # TEST CASE 3 (updateCentroid): points removed and added in bulk
+    cluster2.removeIndex(0)
+    cluster2.removeIndex(0)
+    introcs.assert_equals([1,2,3], cluster2.getIndices())
+    stable = cluster2.update()
+    introcs.assert_float_lists_equal([0.0, 1./3, 1./3], cluster2.getCentroid())
+    introcs.assert_false(stable)
+    cluster2.clear()
+    cluster2.addIndices([3,0,3,1])
+    introcs.assert_equals([3,0,1], cluster2.getIndices())
+    stable = cluster2.update()
+    introcs.assert_float_lists_equal([1./3, 1./3, 1./3], cluster2.getCentroid())
+    introcs.assert_false(stable)
+
     print('    Method Cluster.update() looks okay')
     print('  Part B of class Cluster appears correct')
     print()
@@ -296,6 +527,25 @@ def test_algorithm_a():
     introcs.assert_equals([0.8, 0.4, 0.23, 0.33],   km2.getClusters()[2].getCentroid())
 
     print('    Seeded Algorithm initialization looks okay')
+
+    # The other seeding strategies pick k distinct points from the dataset
+    for init in ['k-means++', 'k-means||']:
+        for k in [1, 3, 4]:
+            km = a6algorithm.Algorithm(dset, k, init=init)
+            centroids = [clust.getCentroid() for clust in km.getClusters()]
+            introcs.assert_equals(k, len(centroids))
+            for cent in centroids:
+                introcs.assert_true(cent in items)
+                introcs.assert_equals(1, centroids.count(cent))
+
+    # k-means++ never picks a point that is on top of an earlier seed
+    same = a6dataset.Dataset(2, [[0.,0.], [0.,0.], [0.,0.], [5.,5.]])
+    for i in range(10):
+        km = a6algorithm.Algorithm(same, 2, init='k-means++')
+        centroids = [clust.getCentroid() for clust in km.getClusters()]
+        introcs.assert_true([5.,5.] in centroids)
+
+    print('    k-means++ and k-means|| initialization look okay')
     print('  Part A of class Algorithm appears correct')
     print()
 
@@ -347,6 +597,18 @@ def test_algorithm_b():
     introcs.assert_equals(set([2,3]), set(km1.getClusters()[0].getIndices()))
     introcs.assert_equals(set([0,1]), set(km1.getClusters()[1].getIndices()))
 
+    # Points equally far from both centroids go to the earlier cluster
+    cluster[0]._centroid = [10.0, 0.0]
+    cluster[1]._centroid = [0.0, 10.0]
+    km1._partition()
+    introcs.assert_equals([0,1,2], km1.getClusters()[0].getIndices())
+    introcs.assert_equals([3], km1.getClusters()[1].getIndices())
+    cluster[0]._centroid = [0.0, 10.0]
+    cluster[1]._centroid = [10.0, 0.0]
+    km1._partition()
+    introcs.assert_equals([0,2,3], km1.getClusters()[0].getIndices())
+    introcs.assert_equals([1], km1.getClusters()[1].getIndices())
+
     # Try it on a file
     index1 = [2, 3, 5, 9, 11, 15, 16, 18, 19, 20, 22, 23, 29, 30, 32, 33, 37, 40, 41, 42,
               44, 45, 50, 60, 61, 62, 64, 69, 71, 73, 75, 76, 78, 80, 85, 88, 90, 94, 97]
@@ -601,16 +863,674 @@ def test_algorithm_d():
     print()
 
 
+def test_algorithm_minibatch():
+    """
+    Tests the mini-batch methods of the Algorithm class.
+    """
+    print('  Testing mini-batch k-means in class Algorithm')
+    items = [[0.,0.], [0.,1.], [1.,0.], [10.,10.], [10.,11.], [11.,10.]]
+    dset = a6dataset.Dataset(2, items)
+
+    # A batch holding the whole dataset is a plain k-means step
+    km1 = a6algorithm.Algorithm(dset, 2, [0, 3])
+    introcs.assert_false(km1.stepMiniBatch(6))
+    introcs.assert_float_lists_equal([1./3, 1./3], km1.getClusters()[0].getCentroid())
+    introcs.assert_float_lists_equal([31./3, 31./3], km1.getClusters()[1].getCentroid())
+    introcs.assert_true(km1.stepMiniBatch(6))
+    introcs.assert_float_lists_equal([1./3, 1./3], km1.getClusters()[0].getCentroid())
+
+    # Small batches still find the two groups, and the clusters get their points
+    random.seed(3)
+    km2 = a6algorithm.Algorithm(dset, 2, [1, 4])
+    km2.runMiniBatch(50, 2)
+    introcs.assert_equals([0, 1, 2], km2.getClusters()[0].getIndices())
+    introcs.assert_equals([3, 4, 5], km2.getClusters()[1].getIndices())
+    for x in km2.getClusters()[0].getCentroid():
+        introcs.assert_true(0 <= x <= 1)
+
+    print('    Methods stepMiniBatch and runMiniBatch look okay')
+    print('  mini-batch k-means appears correct')
+    print()
+
+
+def test_algorithm_hamerly():
+    """
+    Tests that the 'hamerly' engine of the Algorithm class matches the 'lloyd' engine.
+    """
+    print('  Testing the hamerly engine of class Algorithm')
+    items = [[0.,0.], [10.,1.], [10.,10.], [0.,9.]]
+    dset = a6dataset.Dataset(2, items)
+    km1 = a6algorithm.Algorithm(dset, 2, [0,2], engine='hamerly')
+    km1._partition()
+    introcs.assert_equals([0,3], km1.getClusters()[0].getIndices())
+    introcs.assert_equals([1,2], km1.getClusters()[1].getIndices())
+
+    # Moving the centroids by hand must not fool the bounds (and ties go first)
+    cluster = km1.getClusters()
+    cluster[0]._centroid = [0.0, 10.0]
+    cluster[1]._centroid = [10.0, 0.0]
+    km1._partition()
+    introcs.assert_equals([0,2,3], km1.getClusters()[0].getIndices())
+    introcs.assert_equals([1], km1.getClusters()[1].getIndices())
+
+    # Every step should agree with the lloyd engine on a file
+    file = os.path.join(os.path.split(__file__)[0],TEST_FILE)
+    data = a6dataset.Dataset(4, tools.data_for_file(file))
+    km2  = a6algorithm.Algorithm(data, 5, [23, 54, 36, 0, 1])
+    km3  = a6algorithm.Algorithm(data, 5, [23, 54, 36, 0, 1], engine='hamerly')
+    for step in range(20):
+        introcs.assert_equals(km2.step(), km3.step())
+        for pos in range(5):
+            introcs.assert_equals(km2.getClusters()[pos].getIndices(),
+                                  km3.getClusters()[pos].getIndices())
+
+    print('    Method _partition looks okay')
+    print('  the hamerly engine appears correct')
+    print()
+
+
+def test_algorithm_kdtree():
+    """
+    Tests that the 'kdtree' engine of the Algorithm class matches the 'lloyd' engine.
+    """
+    print('  Testing the kdtree engine of class Algorithm')
+    items = [[0.,0.], [10.,1.], [10.,10.], [0.,9.]]
+    dset = a6dataset.Dataset(2, items)
+    km1 = a6algorithm.Algorithm(dset, 2, [0,2], engine='kdtree')
+    km1._partition()
+    introcs.assert_equals([0,3], km1.getClusters()[0].getIndices())
+    introcs.assert_equals([1,2], km1.getClusters()[1].getIndices())
+
+    # Ties go to the first centroid, even when it is in another leaf of the tree
+    cluster = km1.getClusters()
+    cluster[0]._centroid = [0.0, 10.0]
+    cluster[1]._centroid = [10.0, 0.0]
+    km1._partition()
+    introcs.assert_equals([0,2,3], km1.getClusters()[0].getIndices())
+    introcs.assert_equals([1], km1.getClusters()[1].getIndices())
+
+    # Many clusters on a grid, where most points are as close to several centroids
+    grid = [[float(x), float(y)] for x in range(40) for y in range(40)]
+    data = a6dataset.Dataset(2, grid, 'array')
+    seeds = list(range(0, 1600, 7))
+    km2  = a6algorithm.Algorithm(data, len(seeds), seeds)
+    km3  = a6algorithm.Algorithm(data, len(seeds), seeds, engine='kdtree')
+    for step in range(3):
+        introcs.assert_equals(km2.step(), km3.step())
+        introcs.assert_floats_equal(km2.getInertia(), km3.getInertia())
+        for pos in range(len(seeds)):
+            introcs.assert_equals(km2.getClusters()[pos].getIndices(),
+                                  km3.getClusters()[pos].getIndices())
+    introcs.assert_true(km3._evaluations < km2._evaluations)
+
+    # Every step should agree with the lloyd engine on a file
+    file = os.path.join(os.path.split(__file__)[0],TEST_FILE)
+    data = a6dataset.Dataset(4, tools.data_for_file(file))
+    km4  = a6algorithm.Algorithm(data, 5, [23, 54, 36, 0, 1])
+    km5  = a6algorithm.Algorithm(data, 5, [23, 54, 36, 0, 1], engine='kdtree')
+    for step in range(20):
+        introcs.assert_equals(km4.step(), km5.step())
+        for pos in range(5):
+            introcs.assert_equals(km4.getClusters()[pos].getIndices(),
+                                  km5.getClusters()[pos].getIndices())
+
+    print('    Method _partition looks okay')
+    print('  the kdtree engine appears correct')
+    print()
+
+
+def test_algorithm_workers():
+    """
+    Tests that partitioning with several threads matches partitioning with one.
+    """
+    print('  Testing the parallel partition of class Algorithm')
+    file = os.path.join(os.path.split(__file__)[0],TEST_FILE)
+    data = a6dataset.Dataset(4, tools.data_for_file(file), 'array')
+    km1  = a6algorithm.Algorithm(data, 3, [23, 54, 36])
+    km2  = a6algorithm.Algorithm(data, 3, [23, 54, 36], workers=3)
+    km1.run(20)
+    km2.run(20)
+    for pos in range(3):
+        introcs.assert_equals(km1.getClusters()[pos].getIndices(),
+                              km2.getClusters()[pos].getIndices())
+        introcs.assert_float_lists_equal(km1.getClusters()[pos].getCentroid(),
+                                         km2.getClusters()[pos].getCentroid())
+
+    # More workers than points
+    items = [[0.,0.], [10.,1.], [10.,10.], [0.,9.]]
+    km3 = a6algorithm.Algorithm(a6dataset.Dataset(2, items), 2, [0,2], workers=8)
+    km3._update()
+    introcs.assert_float_lists_equal([0.0,4.5], km3.getClusters()[0].getCentroid())
+    introcs.assert_float_lists_equal([10.0,5.5], km3.getClusters()[1].getCentroid())
+
+    print('    Method _partition looks okay')
+    print('  the parallel partition appears correct')
+    print()
+
+
+def test_algorithm_restarts():
+    """
+    Tests the inertia and restarts of the Algorithm class.
+    """
+    print('  Testing restarts of class Algorithm')
+    items = [[0.,0.], [10.,1.], [10.,10.], [0.,9.]]
+    dset = a6dataset.Dataset(2, items)
+    km1 = a6algorithm.Algorithm(dset, 2, [0,2])
+    km1._update()
+    introcs.assert_floats_equal(81.0, km1.getInertia())
+    # Points in no cluster do not count
+    km1.getClusters()[0].removeIndex(3)
+    introcs.assert_floats_equal(60.75, km1.getInertia())
+    km3 = a6algorithm.Algorithm(dset, 2, [0,2], metric='manhattan')
+    km3._update()
+    introcs.assert_floats_equal(18.0, km3.getInertia())
+    print('    Method getInertia looks okay')
+
+    # The winner is returned with its partition and inertia
+    file = os.path.join(os.path.split(__file__)[0],TEST_FILE)
+    data = a6dataset.Dataset(4, tools.data_for_file(file), 'array')
+    random.seed(7)
+    km2, inertia2 = a6algorithm.run_restarts(data, 4, 6, 50, processes=1)
+    after2 = random.random()
+    introcs.assert_floats_equal(inertia2, km2.getInertia())
+    introcs.assert_equals(100, sum([len(c.getIndices()) for c in km2.getClusters()]))
+    introcs.assert_equals(None, a6algorithm._WORKER_DATASET)
+
+    # Worker processes give the same answer as running in this one
+    random.seed(7)
+    km4, inertia4 = a6algorithm.run_restarts(data, 4, 6, 50, processes=2)
+    introcs.assert_floats_equal(inertia2, inertia4)
+    # Neither path reseeds the random stream of the caller
+    introcs.assert_floats_equal(after2, random.random())
+
+    # Restarts through tools.compute, with a convergence tolerance
+    table = tools.compute(file, 3, restarts=2, tolerance=1e-3)
+    introcs.assert_equals(101, len(table))
+    introcs.assert_equals(3, len(set([row[0] for row in table[1:]])))
+
+    print('    Function run_restarts looks okay')
+    print('  restarts appear correct')
+    print()
+
+
+def test_algorithm_tolerance():
+    """
+    Tests the convergence tolerances and history of the Algorithm class.
+    """
+    print('  Testing convergence tolerances of class Algorithm')
+    items = [[0.,0.], [10.,1.], [10.,10.], [0.,9.]]
+    dset = a6dataset.Dataset(2, items)
+    km1 = a6algorithm.Algorithm(dset, 2, [0,2])
+    introcs.assert_true(km1.run(10))
+    history = km1.getHistory()
+    introcs.assert_equals(2, len(history))
+    introcs.assert_equals(1, history[0]['step'])
+    introcs.assert_floats_equal(162.0, history[0]['inertia'])
+    introcs.assert_floats_equal(1.0, history[0]['changed'])
+    introcs.assert_floats_equal(4.5, history[0]['shift'])
+    introcs.assert_false(history[0]['converged'])
+    introcs.assert_floats_equal(81.0, history[1]['inertia'])
+    introcs.assert_floats_equal(0.0, history[1]['changed'])
+    introcs.assert_floats_equal(0.0, history[1]['shift'])
+    introcs.assert_true(history[1]['converged'])
+    print('    Method getHistory looks okay')
+
+    # Each tolerance can stop a run early
+    file = os.path.join(os.path.split(__file__)[0],TEST_FILE)
+    data = a6dataset.Dataset(4, tools.data_for_file(file), 'array')
+    km2 = a6algorithm.Algorithm(data, 3, [23, 54, 36])
+    introcs.assert_true(km2.run(20, shift=1000.0))
+    introcs.assert_equals(1, len(km2.getHistory()))
+    km3 = a6algorithm.Algorithm(data, 3, [23, 54, 36])
+    introcs.assert_true(km3.run(20, changed=1.0))
+    introcs.assert_equals(1, len(km3.getHistory()))
+    km4 = a6algorithm.Algorithm(data, 3, [23, 54, 36])
+    introcs.assert_true(km4.run(20, improvement=1.0))
+    introcs.assert_equals(2, len(km4.getHistory()))
+
+    # Without tolerances, the run continues to exact convergence
+    km5 = a6algorithm.Algorithm(data, 3, [23, 54, 36])
+    introcs.assert_false(km5.run(1))
+    introcs.assert_true(km5.run(50))
+    inertia = [stats['inertia'] for stats in km5.getHistory()]
+    for pos in range(1, len(inertia)):
+        introcs.assert_true(inertia[pos] <= inertia[pos-1]+1e-9)
+    print('    Method run looks okay')
+    print('  convergence tolerances appear correct')
+    print()
+
+
+def test_algorithm_events():
+    """
+    Tests the profiling events of the Algorithm class.
+    """
+    print('  Testing profiling events of class Algorithm')
+    items = [[0.,0.], [10.,1.], [10.,10.], [0.,9.]]
+    dset = a6dataset.Dataset(2, items)
+    km1 = a6algorithm.Algorithm(dset, 2, [0,2])
+    events = []
+    km1.addListener(events.append)
+    km1.run(10)
+    introcs.assert_equals(['partition','update','step']*2, [e['event'] for e in events])
+    introcs.assert_equals([1,1,1,2,2,2], [e['step'] for e in events])
+    introcs.assert_equals(8, events[0]['distances'])
+    introcs.assert_equals(4, events[0]['reassigned'])
+    introcs.assert_equals(0, events[3]['reassigned'])
+    introcs.assert_equals(0, events[0]['empty'])
+    introcs.assert_floats_equal(162.0, events[0]['inertia'])
+    introcs.assert_equals(2, events[1]['moved'])
+    introcs.assert_equals(0, events[4]['moved'])
+    introcs.assert_true(events[5]['converged'])
+    introcs.assert_true(events[2]['time'] >= events[0]['time'])
+
+    # A cluster with no points is reported as empty
+    km1.removeListener(events.append)
+    km2 = a6algorithm.Algorithm(a6dataset.Dataset(2, items+[[0.,0.]]), 2, [0,4])
+    km2.addListener(events.append)
+    km2._partition()
+    introcs.assert_equals(1, events[-1]['empty'])
+    introcs.assert_equals(6, len(events)-1)
+    print('    Method addListener looks okay')
+
+    # The hamerly engine skips distances, and the log holds one event per line
+    file = os.path.join(os.path.split(__file__)[0],TEST_FILE)
+    data = a6dataset.Dataset(4, tools.data_for_file(file), 'array')
+    km3 = a6algorithm.Algorithm(data, 3, [23, 54, 36], engine='hamerly')
+    stream = io.StringIO()
+    log = tools.EventLog(stream)
+    km3.addListener(log)
+    km3.run(20)
+    log.close()
+    lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+    introcs.assert_equals(3*len(km3.getHistory()), len(lines))
+    introcs.assert_equals(300, lines[0]['distances'])
+    introcs.assert_true(lines[-3]['distances'] < 300)
+    print('    Class EventLog looks okay')
+    print('  profiling events appear correct')
+    print()
+
+
+def test_bench():
+    """
+    Tests the helpers of the benchmark harness.
+    """
+    print('  Testing the benchmark harness')
+    import bench
+    points = bench.synthetic(50, 3, 4)
+    introcs.assert_equals((50, 3), points.shape)
+    introcs.assert_true(numpy.array_equal(points, bench.synthetic(50, 3, 4)))
+
+    result = bench.measure('test', lambda: numpy.zeros(1000), 1000, 'floats', 2, n=1000)
+    introcs.assert_equals('test', result['benchmark'])
+    introcs.assert_equals('floats', result['unit'])
+    introcs.assert_equals(1000, result['n'])
+    introcs.assert_true(result['seconds'] >= 0)
+    introcs.assert_true(result['peak_bytes'] >= 8000)
+
+    results = bench.bench_algorithm(points, 4, 1)
+    introcs.assert_equals(2*len(a6algorithm.Algorithm.ENGINES), len(results))
+    json.dumps(results)
+    print('    Function measure looks okay')
+    print('  the benchmark harness appears correct')
+    print()
+
+
+def test_weights():
+    """
+    Tests weighted datasets, clusters and coresets.
+    """
+    print('  Testing weighted datasets')
+    items = [[0.,0.], [10.,1.], [10.,10.], [0.,9.]]
+    dset1 = a6dataset.Dataset(2, items)
+    introcs.assert_false(dset1.isWeighted())
+    introcs.assert_floats_equal(1.0, dset1.getWeight(2))
+    introcs.assert_float_lists_equal([1.0]*4, dset1.getWeights().tolist())
+    dset1.addPoint([5.,5.], 3)
+    introcs.assert_true(dset1.isWeighted())
+    introcs.assert_float_lists_equal([1.0,1.0,1.0,1.0,3.0], dset1.getWeights().tolist())
+    dset1.addPoint([6.,6.])
+    dset1.addPoints([[7.,7.],[8.,8.]], [0.5,0])
+    introcs.assert_float_lists_equal([1.0,1.0,1.0,1.0,3.0,1.0,0.5,0.0],
+                                     dset1.getWeights().tolist())
+    for storage in a6dataset.Dataset.STORAGE_MODES:
+        table = items if storage == 'list' else numpy.array(items)
+        dset2 = a6dataset.Dataset(2, table, storage, [1,2,3,4])
+        introcs.assert_floats_equal(3.0, dset2.getWeight(2))
+        introcs.assert_false(dset2.getWeights().flags.writeable)
+    introcs.assert_error(a6dataset.Dataset, 2, items, 'list', [1,2,3])
+    introcs.assert_error(a6dataset.Dataset, 2, items, 'list', [1,2,3,-1])
+    introcs.assert_error(dset1.addPoints, [[1.,1.]], [1,2])
+    print('    Weighted datasets look okay')
+
+    # A weighted centroid, and a point of weight 2 acts like two copies of it
+    dset3 = a6dataset.Dataset(2, items, 'array', [1,3,1,1])
+    cluster = a6cluster.Cluster(dset3, [0.0,0.0])
+    cluster.addIndices([0,1])
+    cluster.update()
+    introcs.assert_float_lists_equal([7.5,0.75], cluster.getCentroid())
+    introcs.assert_floats_equal(4.0, cluster.getWeight())
+    cluster.removeIndex(1)
+    cluster.addIndex(1)
+    cluster.update()
+    introcs.assert_float_lists_equal([7.5,0.75], cluster.getCentroid())
+
+    file = os.path.join(os.path.split(__file__)[0],TEST_FILE)
+    table = tools.data_for_file(file)
+    double = a6dataset.Dataset(4, table+table[:10])
+    weighted = a6dataset.Dataset(4, table, 'array', [2]*10+[1]*(len(table)-10))
+    for engine in a6algorithm.Algorithm.ENGINES:
+        km1 = a6algorithm.Algorithm(double, 3, [23, 54, 36])
+        km2 = a6algorithm.Algorithm(weighted, 3, [23, 54, 36], engine=engine)
+        km1.run(20)
+        km2.run(20)
+        for pos in range(3):
+            introcs.assert_float_lists_equal(km1.getClusters()[pos].getCentroid(),
+                                             km2.getClusters()[pos].getCentroid())
+        introcs.assert_floats_equal(km1.getInertia(), km2.getInertia())
+    print('    Weighted clustering looks okay')
+
+    # Both seeding strategies favor heavy points
+    heavy = a6dataset.Dataset(2, [[float(i), 0.0] for i in range(100)], 'array',
+                              [1000.0]+[0.001]*99)
+    for init in ['k-means++', 'k-means||']:
+        for seed in range(5):
+            random.seed(seed)
+            km = a6algorithm.Algorithm(heavy, 1, init=init)
+            introcs.assert_float_lists_equal([0.0,0.0], km.getClusters()[0].getCentroid())
+
+    # A coreset is a smaller weighted dataset with about the same total weight
+    copy = a6algorithm.coreset(weighted, 1000)
+    introcs.assert_equals(weighted.getSize(), copy.getSize())
+    introcs.assert_float_lists_equal(weighted.getWeights().tolist(), copy.getWeights().tolist())
+    random.seed(3)
+    import bench
+    data = a6dataset.Dataset(3, bench.synthetic(5000, 3, 4), 'array')
+    summary = a6algorithm.coreset(data, 400)
+    introcs.assert_true(summary.isWeighted())
+    introcs.assert_true(summary.getSize() <= 400)
+    introcs.assert_true((summary.getWeights() > 0).all())
+    introcs.assert_true(abs(summary.getWeights().sum()-5000) < 1000)
+    file = os.path.join(os.path.split(__file__)[0],TEST_FILE)
+    introcs.assert_error(lambda: tools.compute(file, 3, coreset=2))
+    # Repeated samples are topped up, so the summary always has room for k clusters
+    for seed in range(20):
+        random.seed(seed)
+        introcs.assert_equals(20, a6algorithm.coreset(data, 20, 20).getSize())
+    random.seed(4)
+    table = tools.compute(file, 10, limit=5, coreset=10)
+    introcs.assert_equals(10, len(set([row[0] for row in table[1:]])))
+    print('    Function coreset looks okay')
+    print('  weighted datasets appear correct')
+    print()
+
+
+def test_algorithm_resume():
+    """
+    Tests the warm start of the Algorithm class after points are added.
+    """
+    print('  Testing warm starts of class Algorithm')
+    file = os.path.join(os.path.split(__file__)[0],TEST_FILE)
+    table = tools.data_for_file(file)
+    results = []
+    for engine in a6algorithm.Algorithm.ENGINES:
+        data = a6dataset.Dataset(4, table[:80], 'array')
+        km = a6algorithm.Algorithm(data, 3, [23, 54, 36], engine=engine)
+        introcs.assert_true(km.run(50))
+        steps = len(km.getHistory())
+        introcs.assert_equals(0, km._absorb())
+
+        events = []
+        km.addListener(events.append)
+        data.addPoints(table[80:])
+        introcs.assert_true(km.resume(50))
+        introcs.assert_equals('absorb', events[0]['event'])
+        introcs.assert_equals(len(table)-80, events[0]['points'])
+        introcs.assert_true(len(km.getHistory()) > steps)
+
+        # Every point is in the cluster of its nearest centroid, which is its mean
+        indices = []
+        for acluster in km.getClusters():
+            indices.extend(acluster.getIndices())
+            mean = data.getArray()[acluster.getIndices()].mean(axis=0)
+            introcs.assert_float_lists_equal(mean.tolist(), acluster.getCentroid())
+        introcs.assert_equals(list(range(len(table))), sorted(indices))
+        labels = a6algorithm.nearest_labels(data.getArray(), km._centroids())
+        for pos in range(3):
+            introcs.assert_equals(numpy.flatnonzero(labels == pos).tolist(),
+                                  km.getClusters()[pos].getIndices())
+        results.append([acluster.getIndices() for acluster in km.getClusters()])
+
+    # The engines agree on the warm start as well
+    introcs.assert_equals(results[0], results[1])
+    print('    Method resume looks okay')
+    print('  warm starts appear correct')
+    print()
+
+
+def test_metrics():
+    """
+    Tests the distance metrics and clustering with them.
+    """
+    print('  Testing distance metrics')
+    points = numpy.array([[0.,0.], [3.,4.], [1.,1.]])
+    centroids = numpy.array([[1.,0.], [0.,2.]])
+    sq = a6metric.get_metric('sqeuclidean')
+    introcs.assert_float_lists_equal([[1.,4.],[20.,13.],[1.,2.]],
+                                     sq.cost(points, centroids).tolist())
+    introcs.assert_floats_equal(5.0, a6metric.get_metric('euclidean').distance([3,4],[0,0]))
+    introcs.assert_floats_equal(25.0, sq.distance([3,4],[0,0]))
+    l1 = a6metric.get_metric('manhattan')
+    introcs.assert_float_lists_equal([[1.,2.],[6.,5.],[1.,2.]],
+                                     l1.cost(points, centroids).tolist())
+    cos = a6metric.get_metric('cosine')
+    introcs.assert_float_lists_equal([[1.,1.],[0.4,0.2],[1-0.5**0.5,1-0.5**0.5]],
+                                     cos.cost(points, centroids).tolist())
+
+    # Mahalanobis distance scales each feature by its spread
+    maha = a6metric.Mahalanobis(numpy.array([[4.,0.],[0.,1.]]))
+    introcs.assert_floats_equal(2.0, maha.distance([4,1],[0,1]))
+    introcs.assert_floats_equal(2.0, maha.distance([0,3],[0,1]))
+    table = numpy.array([[0.,0.],[2.,0.],[0.,1.],[2.,1.]])
+    introcs.assert_float_lists_equal([[1.,0.],[0.,0.25]], a6metric.covariance(table).tolist())
+
+    # The centers of the metrics
+    introcs.assert_float_lists_equal([1.,1.], l1.center(points).tolist())
+    introcs.assert_float_lists_equal([3.,4.], l1.center(points, numpy.array([1.,3.,1.])).tolist())
+    introcs.assert_float_lists_equal([0.,1.], cos.center(numpy.array([[1.,1.],[-2.,2.]])).tolist())
+    introcs.assert_float_lists_equal([4/3.,5/3.], sq.center(points).tolist())
+    print('    Module a6metric looks okay')
+
+    # Clustering converges to a partition that is stable for each metric
+    file = os.path.join(os.path.split(__file__)[0],TEST_FILE)
+    data = a6dataset.Dataset(4, tools.data_for_file(file), 'array')
+    for name in a6metric.METRICS:
+        km = a6algorithm.Algorithm(data, 3, [23, 54, 36], metric=name)
+        introcs.assert_true(km.run(50))
+        metric = km._metric
+        labels = a6algorithm.nearest_labels(data.getArray(), km._centroids(), metric)
+        for pos in range(3):
+            acluster = km.getClusters()[pos]
+            introcs.assert_equals(numpy.flatnonzero(labels == pos).tolist(),
+                                  acluster.getIndices())
+            center = metric.center(acluster.getArray())
+            introcs.assert_float_lists_equal(center.tolist(), acluster.getCentroid())
+            point = data.getPoint(acluster.getIndices()[0])
+            introcs.assert_floats_equal(metric.distance(point, acluster.getCentroid()),
+                                        acluster.distance(point, metric))
+    introcs.assert_error(a6algorithm.Algorithm, data, 3, None, 'random', 'hamerly', 1, 'cosine')
+    introcs.assert_error(lambda: a6algorithm.run_restarts(data, 3, 2, 10, 1, minibatch=5,
+                                                          metric='manhattan'))
+    introcs.assert_error(lambda: tools.compute(file, 3, minibatch=5, metric='cosine'))
+    print('    Clustering with metrics looks okay')
+    print('  distance metrics appear correct')
+    print()
+
+
+def test_precision():
+    """
+    Tests datasets and clustering in float32 precision.
+    """
+    print('  Testing float32 precision')
+    items = [[0.,0.], [10.,1.], [10.,10.], [0.,9.]]
+    dset = a6dataset.Dataset(2, items, 'array', precision='float32')
+    introcs.assert_equals('float32', dset.getPrecision())
+    introcs.assert_equals(numpy.float32, dset.getArray().dtype)
+    introcs.assert_equals([10.0,1.0], dset.getPoint(1))
+    dset.addPoints(numpy.array([[1.,2.]]))
+    introcs.assert_equals(numpy.float32, dset.getArray().dtype)
+    dset2 = a6dataset.Dataset(2, items, precision='float32')
+    introcs.assert_equals(numpy.float32, dset2.getArray().dtype)
+    introcs.assert_equals('float64', a6dataset.Dataset(2, items).getPrecision())
+    mapped = a6dataset.Dataset(2, numpy.zeros((3,2), dtype=numpy.float32), 'mmap')
+    introcs.assert_equals('float32', mapped.getPrecision())
+    introcs.assert_error(a6dataset.Dataset, 2, items, 'array', None, 'float16')
+
+    # Cluster sums are float64, even for float32 points
+    cluster = a6cluster.Cluster(dset, [0.,0.])
+    cluster.addIndices([0,1,2])
+    introcs.assert_equals(numpy.float64, cluster._sum.dtype)
+    introcs.assert_float_lists_equal([20/3.,11/3.], (cluster._sum/3).tolist())
+    introcs.assert_equals(numpy.float32, a6metric.square_distances(dset.getArray(),
+                          numpy.array([[1.,1.]])).dtype)
+    print('    Class Dataset looks okay')
+
+    # All engines agree in float32, and stay close to float64
+    file = os.path.join(os.path.split(__file__)[0],TEST_FILE)
+    table = tools.data_for_file(file)
+    data  = a6dataset.Dataset(4, table, 'array', precision='float32')
+    full  = a6algorithm.Algorithm(a6dataset.Dataset(4, table, 'array'), 5, [23, 54, 36, 0, 1])
+    full.run(50)
+    runs  = []
+    for engine in a6algorithm.Algorithm.ENGINES:
+        km = a6algorithm.Algorithm(data, 5, [23, 54, 36, 0, 1], engine=engine)
+        introcs.assert_true(km.run(50))
+        runs.append(km)
+    for km in runs:
+        introcs.assert_true(abs(km.getInertia()-full.getInertia()) <= 1e-4*full.getInertia())
+        for pos in range(5):
+            introcs.assert_equals(runs[0].getClusters()[pos].getIndices(),
+                                  km.getClusters()[pos].getIndices())
+            introcs.assert_true(numpy.allclose(full.getClusters()[pos].getCentroid(),
+                                               km.getClusters()[pos].getCentroid(),
+                                               rtol=1e-4, atol=1e-4))
+    introcs.assert_equals('float32', a6algorithm.coreset(data, 20).getPrecision())
+    print('    Class Algorithm looks okay')
+
+    # The output table holds the points as they were read, not widened from float32
+    output = tools.compute(file, 3, precision='float32')
+    source = set([tuple(row) for row in numpy.asarray(table, dtype=float).tolist()])
+    introcs.assert_equals(len(table), len(output)-1)
+    for row in output[1:]:
+        introcs.assert_true(tuple(row[1:5]) in source)
+    print('    Function compute looks okay')
+    print('  float32 precision appears correct')
+    print()
+
+
+def test_batch():
+    """
+    Tests clustering many files with tools.batch.
+    """
+    print('  Testing batch clustering')
+    folder = tempfile.mkdtemp()
+    source = os.path.join(os.path.split(__file__)[0],'data')
+    for name in ['basic-2d.csv','scattered-2d.csv']:
+        shutil.copy(os.path.join(source,name),folder)
+    files = tools.find_csv(folder)
+    introcs.assert_equals(['basic-2d.csv','scattered-2d.csv'],
+                          [os.path.basename(x) for x in files])
+    introcs.assert_equals(files[:1],tools.find_csv(os.path.join(folder,'b*.csv')))
+
+    output = os.path.join(folder,'out')
+    random.seed(1)
+    jobs = tools.batch(files,[2,3,600],output,1)
+    after = random.random()
+    introcs.assert_equals({},tools._BATCH_DATA)
+    introcs.assert_equals(6,len(jobs))
+    introcs.assert_equals([2,3,600,2,3,600],[job['k'] for job in jobs])
+    introcs.assert_true('error' in jobs[2] and 'error' in jobs[5])
+    header, data = tools.read_dataset(os.path.join(output,'basic-2d-k3.csv'))
+    introcs.assert_equals(['CID','X','Y','C_X','C_Y'],header)
+    introcs.assert_equals(jobs[1]['points'],len(data))
+
+    # The results do not depend on the number of processes
+    random.seed(1)
+    again = tools.batch(files,[2,3,600],output,2)
+    introcs.assert_floats_equal(after,random.random())
+    for job1, job2 in zip(jobs,again):
+        introcs.assert_equals(job1.get('inertia'),job2.get('inertia'))
+    shutil.rmtree(folder)
+    print('    Function batch looks okay')
+    print('  batch clustering appears correct')
+    print()
+
+
+def test_select_k():
+    """
+    Tests the silhouette and the selection of k.
+    """
+    print('  Testing the selection of k')
+    points = numpy.array([[0.,0.], [0.,1.], [10.,0.], [10.,1.]])
+    labels = numpy.array([0,0,1,1])
+    # a = 1 and b = (10+sqrt(101))/2 for every point
+    b = (10+101**0.5)/2
+    introcs.assert_floats_equal((b-1)/b, a6algorithm.silhouette(points, labels))
+    introcs.assert_floats_equal(0.0, a6algorithm.silhouette(points, numpy.array([0,1,2,3])))
+    introcs.assert_equals(None, a6algorithm.silhouette(points, numpy.zeros(4, dtype=int)))
+    print('    Function silhouette looks okay')
+
+    # Three well separated blobs
+    rng = numpy.random.RandomState(5)
+    centers = numpy.array([[0.,0.], [20.,0.], [0.,20.]])
+    table = centers[numpy.arange(600) % 3]+rng.normal(0, 1, (600, 2))
+    data = a6dataset.Dataset(2, table, 'array')
+    random.seed(2)
+    best, curve = a6algorithm.select_k(data, [1,2,3,4,5], sample=200, init='k-means++')
+    introcs.assert_equals(3, best)
+    introcs.assert_equals([1,2,3,4,5], [entry['k'] for entry in curve])
+    introcs.assert_equals(None, curve[0]['silhouette'])
+    inertias = [entry['inertia'] for entry in curve]
+    introcs.assert_true(inertias[0] > inertias[1] > inertias[2])
+
+    # The result does not depend on the number of threads
+    random.seed(2)
+    again = a6algorithm.select_k(data, [1,2,3,4,5], threads=1, sample=200, init='k-means++')
+    introcs.assert_equals(best, again[0])
+    for entry1, entry2 in zip(curve, again[1]):
+        introcs.assert_equals(entry1['inertia'], entry2['inertia'])
+        introcs.assert_equals(entry1['silhouette'], entry2['silhouette'])
+    print('    Function select_k looks okay')
+    print('  the selection of k appears correct')
+    print()
+
+
 def test_all():
     """
     Invokes all tests
     """
     print('Starting unit test\n')
+    test_checks()
     test_dataset()
+    test_dataset_array()
+    test_read_dataset()
     test_cluster_a()
     test_cluster_b()
     test_algorithm_a()
     test_algorithm_b()
     test_algorithm_c()
     test_algorithm_d()
+    test_algorithm_minibatch()
+    test_algorithm_hamerly()
+    test_algorithm_kdtree()
+    test_algorithm_workers()
+    test_algorithm_restarts()
+    test_algorithm_tolerance()
+    test_algorithm_events()
+    test_bench()
+    test_weights()
+    test_algorithm_resume()
+    test_metrics()
+    test_precision()
+    test_batch()
+    test_select_k()
     print('All test cases passed!')
@@ -0,0 +1,332 @@
+"""
+Benchmarks for k-Means clustering
+
+This file times the main operations of the cluster package: building a Dataset, the
+Cluster methods, partitioning, full runs of the Algorithm, and tools.compute on the
+bundled data files.  The synthetic benchmarks use seeded random data, so two runs on
+the same machine measure the same work.
+
+Every measurement is written as one line of JSON, so the results of two versions can
+be compared by a script.  Run it from this folder with
+
+    python bench.py [--quick] [--repeat N] [--output FILE] [--only NAME]
+
+The first line describes the machine.  Each other line has the keys
+    'benchmark':  the name of the benchmark
+    'seconds':    the fastest of the timed repetitions
+    'throughput': the number of items (see 'unit') processed per second
+    'unit':       what an item is, such as 'points' or 'distances'
+    'peak_bytes': the peak memory allocated during one extra repetition, as measured
+                  by tracemalloc (which numpy reports its arrays to)
+plus the parameters of the benchmark, like n, d and k.
+"""
+import argparse
+import gc
+import glob
+import json
+import os, os.path
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy
+
+import a6dataset
+import a6cluster
+import a6algorithm
+import tools
+
+
+# The folders with the bundled data files
+DATA_DIRS = [os.path.join(os.path.split(__file__)[0], 'data'),
+             os.path.join(os.path.split(__file__)[0], '..', 'datasets')]
+
+# The (n, d, k) sizes of the synthetic benchmarks
+SIZES = [(10000, 2, 5), (10000, 2, 50), (10000, 16, 5), (100000, 2, 5), (100000, 8, 50)]
+
+# The smaller sizes used with --quick
+QUICK_SIZES = [(2000, 2, 5), (2000, 8, 20)]
+
+# The most steps of a benchmarked run
+MAX_STEPS = 10
+
+
+def synthetic(n, d, k, seed=0):
+    """
+    Returns an n x d numpy array of points drawn around k random centers.
+
+    The centers are uniform in [-10,10]^d and each point is a unit gaussian around a
+    random center, so the points form k clusters.  The same arguments always give
+    the same points.
+
+    Parameter n: The number of points
+    Precondition: n is an int > 0
+
+    Parameter d: The dimension of the points
+    Precondition: d is an int > 0
+
+    Parameter k: The number of centers
+    Precondition: k is an int > 0
+
+    Parameter seed: The seed of the random generator (OPTIONAL)
+    Precondition: seed is an int >= 0
+    """
+    rng = numpy.random.RandomState(seed)
+    centers = rng.uniform(-10, 10, (k, d))
+    labels = rng.randint(k, size=n)
+    return centers[labels]+rng.normal(0, 1, (n, d))
+
+
+def measure(name, func, items, unit, repeat=3, **params):
+    """
+    Returns a dictionary with the time and memory used by func.
+
+    func is called repeat times, and the fastest time is kept.  It is then called once
+    more while tracemalloc records the peak memory allocated.  The dictionary has the
+    keys described at the top of this file, and the keyword arguments params.
+
+    Parameter name: The name of the benchmark
+    Precondition: name is a string
+
+    Parameter func: The operation to measure
+    Precondition: func is a callable with no arguments
+
+    Parameter items: The number of items func processes in one call
+    Precondition: items is an int >= 0
+
+    Parameter unit: What an item is
+    Precondition: unit is a string
+
+    Parameter repeat: The number of timed calls (OPTIONAL)
+    Precondition: repeat is an int > 0
+    """
+    best = None
+    for i in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter()-start
+        best = elapsed if best is None else min(best, elapsed)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    result = {'benchmark': name, 'seconds': best, 'unit': unit, 'peak_bytes': peak,
+              'throughput': items/best if best > 0 else None}
+    result.update(params)
+    return result
+
+
+def environment():
+    """
+    Returns a dictionary describing the machine and the library versions.
+    """
+    return {'benchmark': 'environment', 'python': platform.python_version(),
+            'numpy': numpy.__version__, 'platform': platform.platform(),
+            'machine': platform.machine(), 'cpus': os.cpu_count()}
+
+
+def bench_dataset(points, repeat):
+    """
+    Returns a list of results for building a Dataset from points.
+
+    Parameter points: The points
+    Precondition: points is a 2d numpy array of floats
+
+    Parameter repeat: The number of timed calls
+    Precondition: repeat is an int > 0
+    """
+    n, d = points.shape
+    table = points.tolist()
+    results = []
+    for storage in ('list', 'array'):
+        results.append(measure('dataset.init', lambda: a6dataset.Dataset(d, table, storage),
+                               n, 'points', repeat, n=n, d=d, storage=storage))
+    def grow():
+        dset = a6dataset.Dataset(d, None, 'array')
+        dset.addPoints(points)
+    results.append(measure('dataset.addPoints', grow, n, 'points', repeat, n=n, d=d,
+                           storage='array'))
+    return results
+
+
+def bench_cluster(points, repeat):
+    """
+    Returns a list of results for the methods of a Cluster holding all of points.
+
+    Parameter points: The points
+    Precondition: points is a 2d numpy array of floats
+
+    Parameter repeat: The number of timed calls
+    Precondition: repeat is an int > 0
+    """
+    n, d = points.shape
+    dset = a6dataset.Dataset(d, points, 'array')
+    cluster = a6cluster.Cluster(dset, dset.getPoint(0))
+    cluster.addIndices(list(range(n)))
+    # Cluster.distance works a point at a time, so time a bounded number of calls
+    calls = min(n, 10000)
+    sample = [dset.getPoint(i) for i in range(calls)]
+    def distances():
+        for apoint in sample:
+            cluster.distance(apoint)
+    results = [measure('cluster.distance', distances, calls, 'points', repeat, n=n, d=d)]
+    # update reads the running sums of the cluster, so its cost does not depend on n
+    results.append(measure('cluster.update', cluster.update, 1, 'updates', repeat, n=n, d=d))
+    # getRadius is cached per centroid, so move the centroid before every call
+    moves = [0]
+    def radius():
+        moves[0] += 1
+        cluster.setCentroid([moves[0]*1e-9]*d)
+        cluster.getRadius()
+    results.append(measure('cluster.getRadius', radius, n, 'points', repeat, n=n, d=d))
+    return results
+
+
+def bench_algorithm(points, k, repeat):
+    """
+    Returns a list of results for partitioning and running k-means on points.
+
+    Every engine is measured.  The 'partition' benchmarks time one _partition() of
+    the initial centroids (for the 'hamerly' engine, this includes building its
+    bounds).  The 'run' benchmarks time run() from the same seeds, for at most
+    MAX_STEPS steps; their throughput counts the points labeled in every step.
+
+    Parameter points: The points
+    Precondition: points is a 2d numpy array of floats
+
+    Parameter k: The number of clusters
+    Precondition: k is an int, 0 < k <= len(points)
+
+    Parameter repeat: The number of timed calls
+    Precondition: repeat is an int > 0
+    """
+    n, d = points.shape
+    dset = a6dataset.Dataset(d, points, 'array')
+    seeds = list(range(k))
+    results = []
+    for engine in a6algorithm.Algorithm.ENGINES:
+        def partition():
+            a6algorithm.Algorithm(dset, k, seeds, engine=engine)._partition()
+        results.append(measure('algorithm.partition', partition, n*k, 'distances', repeat,
+                               n=n, d=d, k=k, engine=engine))
+
+        steps = []
+        def run():
+            km = a6algorithm.Algorithm(dset, k, seeds, engine=engine)
+            km.run(MAX_STEPS)
+            steps.append(len(km.getHistory()))
+        result = measure('algorithm.run', run, 0, 'points', repeat, n=n, d=d, k=k,
+                         engine=engine)
+        result['steps'] = steps[-1]
+        result['throughput'] = n*steps[-1]/result['seconds']
+        results.append(result)
+    return results
+
+
+def bench_compute(repeat, k=5):
+    """
+    Returns a list of results for tools.compute on each bundled data file.
+
+    The files are parsed into a fresh temporary cache (see tools.load_dataset) before
+    they are timed, so the results measure clustering and not parsing.  The time of the
+    first, uncached, load is reported as 'tools.load_dataset' (without its memory).
+
+    Parameter repeat: The number of timed calls
+    Precondition: repeat is an int > 0
+
+    Parameter k: The number of clusters (OPTIONAL)
+    Precondition: k is an int > 0
+    """
+    results = []
+    saved = tools.CACHE_DIR
+    try:
+        with tempfile.TemporaryDirectory() as cache:
+            tools.CACHE_DIR = cache
+            for folder in DATA_DIRS:
+                for filename in sorted(glob.glob(os.path.join(folder, '*.csv'))):
+                    name = os.path.basename(filename)
+                    start = time.perf_counter()
+                    size = len(tools.load_dataset(filename)[1])
+                    elapsed = time.perf_counter()-start
+                    results.append({'benchmark': 'tools.load_dataset', 'file': name, 'n': size,
+                                    'seconds': elapsed, 'unit': 'points',
+                                    'throughput': size/elapsed, 'peak_bytes': None})
+                    if size < k:
+                        continue
+                    def compute():
+                        random.seed(0)
+                        tools.compute(filename, k, limit=MAX_STEPS)
+                    results.append(measure('tools.compute', compute, size, 'points', repeat,
+                                           file=name, n=size, k=k))
+    finally:
+        tools.CACHE_DIR = saved
+    return results
+
+
+def run_all(sizes, repeat, only=None):
+    """
+    Returns an iterator over the results of all benchmarks.
+
+    Parameter sizes: The (n, d, k) sizes of the synthetic benchmarks
+    Precondition: sizes is a list of triples of ints > 0, with k <= n
+
+    Parameter repeat: The number of timed calls of each benchmark
+    Precondition: repeat is an int > 0
+
+    Parameter only: The group of benchmarks to run (OPTIONAL)
+    Precondition: only is None or one of 'dataset', 'cluster', 'algorithm', 'compute'
+    """
+    yield environment()
+    for (n, d, k) in sizes:
+        points = synthetic(n, d, k)
+        if only in (None, 'dataset'):
+            yield from bench_dataset(points, repeat)
+        if only in (None, 'cluster'):
+            yield from bench_cluster(points, repeat)
+        if only in (None, 'algorithm'):
+            yield from bench_algorithm(points, k, repeat)
+    if only in (None, 'compute'):
+        yield from bench_compute(repeat)
+
+
+def parse():
+    """
+    Returns: the command line arguments
+    """
+    parser = argparse.ArgumentParser(description='Benchmark the k-means clustering package')
+    parser.add_argument('-q','--quick', action='store_true', help='only use small synthetic data')
+    parser.add_argument('-r','--repeat', type=int, default=3, help='timed calls per benchmark')
+    parser.add_argument('-o','--output', type=str, help='the file for the results (JSON lines)')
+    parser.add_argument('--only', choices=['dataset','cluster','algorithm','compute'],
+                        help='only run this group of benchmarks')
+    result = parser.parse_args()
+    if result.repeat <= 0:
+        parser.error('the number of repetitions must be an int > 0.')
+    return result
+
+
+def execute():
+    """
+    Runs the benchmarks named on the command line.
+    """
+    args = parse()
+    stream = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        for result in run_all(QUICK_SIZES if args.quick else SIZES, args.repeat, args.only):
+            stream.write(json.dumps(result, sort_keys=True)+'\n')
+            stream.flush()
+    finally:
+        if args.output:
+            stream.close()
+
+
+if __name__ == '__main__':
+    execute()
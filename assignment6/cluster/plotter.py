@@ -211,7 +211,7 @@ class Visualizer(object):
             c = self.COLORS[k % len(self.COLORS)]
             m = 'x' if (k//10) % 2 == 1 else '+'
             cluster = self._kmean.getClusters()[k]
-            rows = numpy.array(cluster.getContents())
+            rows = cluster.getArray()
             cent = cluster.getCentroid()
             if self._kbool.get().lower() == 'true':
                 rads = cluster.getRadius()
@@ -7,8 +7,25 @@ Authors: Walker M. White (wmw2)
 Date: October 18, 2018
 """
 import traceback
-import introcs
 import os, sys
+import csv
+import glob
+import hashlib
+import json
+import random
+import tempfile
+import time
+import concurrent.futures
+import numpy
+import a6checks
+
+
+# The number of rows parsed at once by read_dataset
+CHUNK_ROWS = 4096
+
+# The directory where load_dataset caches parsed files (CLUSTER_CACHE='' turns it off)
+CACHE_DIR = os.environ.get('CLUSTER_CACHE',
+                           os.path.join(os.path.expanduser('~'),'.cache','cluster'))
 
 
 def data_for_file(filename):
@@ -21,21 +38,139 @@ def data_for_file(filename):
     Parameter filename: The file to parse
     Precondition: filename is a name of a CSV file.
     """
+    if filename is None:
+        return None
+    return load_dataset(filename)[1].tolist()
+
+
+def load_dataset(filename):
+    """
+    Returns a pair (header, data) for the given CSV file, using the dataset cache.
+    
+    This is the same as read_dataset, except that the parsed file is saved in CACHE_DIR
+    as a .npy file, and data is a read-only numpy.memmap of that file.  Later loads of
+    the same file map it again instead of parsing the text.  An entry is
+    keyed by the path, modification time and size of the file, so editing the file makes
+    the next load parse it again (and replace the old entry).
+    
+    If CACHE_DIR is empty, or the cache cannot be read or written, this simply parses
+    the file.
+    
+    Parameter filename: The file to parse
+    Precondition: filename is a name of a CSV file.
+    """
+    if not CACHE_DIR:
+        return read_dataset(filename)
+    entry = None
     try:
-        if filename is None:
-            return None
-        
-        table = introcs.read_csv(filename)
+        path = os.path.abspath(filename)
+        info = os.stat(path)
+        name = hashlib.sha1(path.encode('utf-8')).hexdigest()
+        stamp = hashlib.sha1(('%d:%d' % (info.st_mtime_ns,info.st_size)).encode()).hexdigest()
+        entry = os.path.join(CACHE_DIR,name+'-'+stamp[:16])
+        with open(entry+'.json') as file:
+            header = json.load(file)['header']
+        return (header, numpy.load(entry+'.npy', mmap_mode='r'))
+    except Exception:
+        pass
+    
+    header, data = read_dataset(filename)
+    try:
+        if entry:
+            _save_entry(entry, path, header, data)
+            data = numpy.load(entry+'.npy', mmap_mode='r')
+    except Exception:
+        pass
+    return (header, data)
+
+
+def _save_entry(entry, path, header, data):
+    """
+    Saves a parsed CSV file in the dataset cache, replacing older entries for it.
+    
+    Each file is written under a temporary name and then renamed, so that a concurrent
+    load never sees a partial entry.  The .npy file is written before the .json file,
+    which load_dataset reads first.
+    
+    Parameter entry: The cache entry path, without extension
+    Precondition: entry is a string, in CACHE_DIR
+    
+    Parameter path: The absolute path of the CSV file
+    Precondition: path is a string
+    
+    Parameter header: The attributes of the file
+    Precondition: header is a list of strings
+    
+    Parameter data: The contents of the file
+    Precondition: data is a 2d numpy array of float64
+    """
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    prefix = os.path.basename(entry).split('-')[0]
+    for old in glob.glob(os.path.join(CACHE_DIR,prefix+'-*')):
+        if not old.startswith(entry+'.'):
+            os.remove(old)
+    
+    fd, temp = tempfile.mkstemp(dir=CACHE_DIR, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as file:
+        numpy.save(file, numpy.ascontiguousarray(data))
+    os.replace(temp, entry+'.npy')
+    
+    fd, temp = tempfile.mkstemp(dir=CACHE_DIR, suffix='.tmp')
+    with os.fdopen(fd, 'w') as file:
+        json.dump({'file': path, 'header': header}, file)
+    os.replace(temp, entry+'.json')
+
+
+def read_dataset(filename):
+    """
+    Returns a pair (header, data) for the given CSV file.
+    
+    The header is the list of attributes in the first row, and data is a 2d numpy array
+    of float64 with one row per remaining line.  As in data_for_file, the column COMMENTS
+    is ignored, so it is in neither.
+    
+    The file is read in one streaming pass.  A quick scan first counts the lines, so
+    that data can be allocated once.  Then the rows are parsed a chunk of CHUNK_ROWS at
+    a time straight into data.  Hence the memory used is about the size of data, and
+    not that of a table of strings for the whole file.
+    
+    Parameter filename: The file to parse
+    Precondition: filename is a name of a CSV file.
+    """
+    try:
+        with open(filename, 'rb') as file:
+            lines = 1
+            block = file.read(1 << 20)
+            while block:
+                lines += block.count(b'\n')
+                block = file.read(1 << 20)
         
-        # Is there a column called COMMENTS?
-        header = list(map(lambda x: x.lower(), table[0]))
-        pos = header.index('comments') if 'comments' in header else len(header)
-        contents = []
-        for row in table[1:]:
-            point = row[:pos]+row[pos+1:]
-            contents.append(list(map(float,point)))
+        with open(filename, newline='') as file:
+            reader = csv.reader(file)
+            header = next(reader)
+            
+            # Is there a column called COMMENTS?
+            lower = list(map(lambda x: x.lower(), header))
+            pos = lower.index('comments') if 'comments' in lower else len(header)
+            data = numpy.empty((lines, len(header)-(pos < len(header))))
+            
+            size  = 0
+            chunk = []
+            for row in reader:
+                assert len(row) == len(header), 'line %d has the wrong size' % reader.line_num
+                chunk.append(row[:pos]+row[pos+1:])
+                if len(chunk) == CHUNK_ROWS:
+                    data[size:size+len(chunk)] = numpy.array(chunk, dtype=numpy.float64)
+                    size += len(chunk)
+                    chunk = []
+            if chunk:
+                data[size:size+len(chunk)] = numpy.array(chunk, dtype=numpy.float64)
+                size += len(chunk)
         
-        return contents
+        header = header[:pos]+header[pos+1:]
+        # Outside data is always checked, even in trusted mode
+        assert a6checks.is_finite_array(data[:size]), 'the data has NaN or infinite values'
+        return (header, data[:size])
     except:
         traceback.print_exc()
         raise AssertionError('%s is not a valid dataset' % repr(filename))
@@ -66,10 +201,72 @@ def list_csv(directory,suffix=None):
     return result
 
 
-def compute(filename,k,limit=500):
+def find_csv(source):
+    """
+    Returns the sorted list of CSV file paths named by source.
+    
+    If source is a directory, these are the CSV files in it (see list_csv).  Otherwise
+    source is a glob pattern, like 'data/*-2d.csv', and these are the files it matches.
+    
+    Parameter source: The directory or pattern
+    Precondition: source is a string
+    """
+    if os.path.isdir(source):
+        return [os.path.join(source,name+'.csv') for name in list_csv(source)]
+    return sorted(glob.glob(source))
+
+
+class EventLog(object):
+    """
+    A listener for Algorithm.addListener that writes each event as a line of JSON.
+
+    The output can be read back with one json.loads per line, so it is easy to load
+    into other tools to find out where a clustering job spends its time.
+
+    INSTANCE ATTRIBUTES:
+        _stream [file]: the text stream the events are written to
+        _owned [bool]: True if the stream was opened by this log (and closed by close)
+    """
+
+    def __init__(self, output):
+        """
+        Initializes a log writing to output.
+
+        Parameter output: The file to write to
+        Precondition: output is a file name (which is overwritten) or a writable text
+        stream
+        """
+        self._owned = isinstance(output, str)
+        self._stream = open(output, 'w') if self._owned else output
+
+    def __call__(self, event):
+        """
+        Writes event as one line of JSON.
+
+        Parameter event: The event to write
+        Precondition: event is a dictionary that json can encode
+        """
+        self._stream.write(json.dumps(event, sort_keys=True)+'\n')
+
+    def close(self):
+        """
+        Flushes the log, and closes its file if the log opened it.
+        """
+        if self._owned:
+            self._stream.close()
+        else:
+            self._stream.flush()
+
+
+def compute(filename,k,limit=500,minibatch=None,init='random',engine='lloyd',workers=1,
+            restarts=1,tolerance=None,profile=None,coreset=None,metric='euclidean',
+            precision='float64'):
     """
     Computes the result of a k-means algorithm and returns it as a table [with header]
     
+    If minibatch is given, this uses mini-batch k-means with batches of that size
+    instead of the full k-means algorithm.
+    
     Parameter filename: The name of the initial dataset
     Precondition: filename is a valid file path OR None.
     
@@ -78,22 +275,140 @@ def compute(filename,k,limit=500):
     
     Parameter limit: The limit on the number of iterations to run
     Precondition: limit is an int >= 0
+    
+    Parameter minibatch: The mini-batch size (OPTIONAL)
+    Precondition: minibatch is None or an int > 0; it is None unless metric is one of
+    the strings in a6metric.MEAN_METRICS
+    
+    Parameter init: The seeding strategy (OPTIONAL)
+    Precondition: init is one of the strings in Algorithm.INIT_MODES
+    
+    Parameter engine: The partitioning engine (OPTIONAL)
+    Precondition: engine is one of the strings in Algorithm.ENGINES
+    
+    Parameter workers: The number of threads for partitioning (OPTIONAL)
+    Precondition: workers is an int > 0
+    
+    Parameter restarts: The number of runs to keep the best (lowest inertia) of (OPTIONAL)
+    Precondition: restarts is an int > 0
+    
+    Parameter tolerance: The centroid shift that counts as converged (OPTIONAL)
+    Precondition: tolerance is None or a number >= 0
+    
+    Parameter profile: A file to write the profiling events of the run to, as in
+    EventLog.  It is ignored when restarts > 1, as those runs happen in other processes.
+    Precondition: profile is None or a file name
+    
+    Parameter coreset: The size of a weighted summary to cluster instead of the whole
+    dataset (see a6algorithm.coreset); every point is then assigned to the nearest of
+    the centroids found (OPTIONAL)
+    Precondition: coreset is None or an int >= k
+    
+    Parameter metric: The distance measure (OPTIONAL)
+    Precondition: metric is one of the strings in a6metric.METRICS
+    
+    Parameter precision: The float type of the points (OPTIONAL).  With 'float32', the
+    points are copied into memory at that precision, as the cache holds float64.
+    Precondition: precision is one of the strings in Dataset.PRECISIONS
     """
-    data = data_for_file(filename)
+    import a6metric
+    assert not minibatch or metric in a6metric.MEAN_METRICS, \
+        'mini-batch steps need a metric whose center is the mean'
+    header, data = load_dataset(filename)
     if len(data) == 0:
         return []
     
-    # Get the header again
-    table = introcs.read_csv(filename)
-    # Is there a column called COMMENTS?
-    header = list(filter(lambda x: x.lower() != 'comments', table[0]))
+    dset = _make_dataset(header, data, precision)
+    km = _cluster(dset, k, limit, minibatch, init, engine, workers, restarts, tolerance,
+                  profile, coreset, metric)
+    return _table(header, km, data)
+
+
+def _make_dataset(header, data, precision='float64'):
+    """
+    Returns a Dataset for the data loaded by load_dataset.
+    
+    Parameter header: The column names
+    Precondition: header is a list of strings
     
+    Parameter data: The points
+    Precondition: data is a non-empty 2d numpy array with len(header) columns
+    
+    Parameter precision: The float type of the points (OPTIONAL)
+    Precondition: precision is one of the strings in Dataset.PRECISIONS
+    """
     import a6dataset
+    # Mapped data from the cache can stay on disk
+    storage = 'mmap' if isinstance(data, numpy.memmap) else 'array'
+    if precision != data.dtype:
+        storage = 'array'
+    return a6dataset.Dataset(len(header), data, storage, precision=precision)
+
+
+def _cluster(dset,k,limit=500,minibatch=None,init='random',engine='lloyd',workers=1,
+             restarts=1,tolerance=None,profile=None,coreset=None,metric='euclidean',
+             processes=None):
+    """
+    Returns the Algorithm that clustered dset, as described in compute.
+    
+    The parameters are those of compute, except for dset and processes.
+    
+    Parameter dset: The dataset to cluster
+    Precondition: dset is a non-empty Dataset
+    
+    Parameter processes: The number of processes for the restarts (OPTIONAL)
+    Precondition: processes is None (one per CPU) or an int > 0
+    """
     import a6algorithm
-    dset = a6dataset.Dataset(len(data[0]), data)
-    km   = a6algorithm.Algorithm(dset, k)
-    km.run(limit)
+    assert coreset is None or coreset >= k, 'the coreset size %d is less than k' % coreset
+    clustered = a6algorithm.coreset(dset, coreset, k) if coreset else dset
+    assert k <= clustered.getSize(), '%d clusters is more than the %d points' % (k,clustered.getSize())
+    if restarts > 1:
+        km = a6algorithm.run_restarts(clustered, k, restarts, limit, processes,
+                                      init=init, engine=engine, workers=workers,
+                                      minibatch=minibatch, tolerance=tolerance,
+                                      metric=metric)[0]
+    else:
+        km = a6algorithm.Algorithm(clustered, k, init=init, engine=engine, workers=workers,
+                                   metric=metric)
+        log = EventLog(profile) if profile else None
+        if log:
+            km.addListener(log)
+        try:
+            if minibatch:
+                km.runMiniBatch(limit,minibatch)
+            else:
+                km.run(limit,shift=tolerance)
+        finally:
+            if log:
+                log.close()
+    
+    if coreset:
+        # Assign the whole dataset to the centroids found on the summary
+        full = a6algorithm.Algorithm(dset, k, list(range(k)), metric=metric)
+        for acluster, summary in zip(full.getClusters(), km.getClusters()):
+            acluster.setCentroid(summary.getCentroid())
+        full._partition()
+        km = full
+    return km
+
+
+def _table(header, km, data=None):
+    """
+    Returns the clustering of km as a table [with header], as described in compute.
     
+    The point columns come from data when it is given, so that a dataset stored at a
+    lower precision still writes the values that were read.
+    
+    Parameter header: The column names
+    Precondition: header is a list of strings, one per dimension of the dataset of km
+    
+    Parameter km: The clustering
+    Precondition: km is an Algorithm whose clusters hold their points
+    
+    Parameter data: The points the dataset of km was made from (OPTIONAL)
+    Precondition: data is None or a 2d numpy array with a row for each point of km
+    """
     result = []
     newhead = ['CID']+header
     for x in header:
@@ -103,8 +418,111 @@ def compute(filename,k,limit=500):
     clusters = km.getClusters()
     for x in range(len(clusters)):
         for y in clusters[x].getIndices():
-            row = [x+1]+clusters[x]._dataset.getPoint(y) # BAD
+            if data is None:
+                row = [x+1]+clusters[x]._dataset.getPoint(y) # BAD
+            else:
+                row = [x+1]+data[y].tolist()
             row.extend(clusters[x].getCentroid())
             result.append(row)
     
     return result
+
+
+# The datasets loaded by the batch jobs of this process, by file name
+_BATCH_DATA = {}
+
+
+def batch(files,kvalues,outdir,processes=None,**options):
+    """
+    Clusters every file for every k, and returns a list with a summary of each job.
+    
+    The table of each job (see compute) is written to outdir as NAME-kK.csv, where NAME
+    is the name of the file without its extension.  All jobs run in this process and
+    its worker pool, so Python and numpy start only once.  The jobs of a file are
+    handed to the workers together, when there are enough files to keep them all
+    busy, so each file is usually loaded once and reused for every k.
+    
+    The summary of a job is a dictionary with the keys 'file', 'k', 'output', 'points',
+    'inertia', 'steps' (the length of the run history, which is 0 for mini-batch runs)
+    and 'seconds'.  A job that fails (for example, because k is
+    larger than the file) does not stop the batch; its summary has an 'error' key with
+    the message instead.  The summaries are in the order of files, then kvalues.
+    
+    The random seed of each job is drawn from the random module, so the results are
+    repeatable after random.seed, whatever the number of processes.
+    
+    Parameter files: The CSV files to cluster
+    Precondition: files is a list of file names
+    
+    Parameter kvalues: The numbers of clusters
+    Precondition: kvalues is a non-empty list of ints > 0
+    
+    Parameter outdir: The directory for the result tables; it is created if needed
+    Precondition: outdir is a string
+    
+    Parameter processes: The number of worker processes (OPTIONAL)
+    Precondition: processes is None (one per CPU) or an int > 0
+    
+    Parameter options: The keyword arguments limit, minibatch, init, engine, workers,
+    restarts, tolerance, coreset, metric and precision of compute (OPTIONAL)
+    Precondition: the options are as in compute
+    """
+    assert isinstance(kvalues, list) and len(kvalues) > 0
+    assert processes is None or (isinstance(processes, int) and processes > 0)
+    os.makedirs(outdir, exist_ok=True)
+    jobs = [(filename, k, outdir, random.getrandbits(32), options)
+            for filename in files for k in kvalues]
+    if processes == 1 or len(jobs) <= 1:
+        # The jobs reseed the random module, so restore the stream of the caller
+        state = random.getstate()
+        try:
+            return list(map(_batch_job, jobs))
+        finally:
+            _BATCH_DATA.clear()
+            random.setstate(state)
+    
+    workers = processes or os.cpu_count() or 1
+    chunk = len(kvalues) if len(files) >= workers else 1
+    with concurrent.futures.ProcessPoolExecutor(processes) as pool:
+        return list(pool.map(_batch_job, jobs, chunksize=chunk))
+
+
+def _batch_job(job):
+    """
+    Runs one job of batch, and returns its summary.
+    
+    The restarts of the job run in this process, so worker processes do not start
+    pools of their own.
+    
+    Parameter job: The job
+    Precondition: job is a tuple (filename, k, outdir, seed, options), as made by batch
+    """
+    filename, k, outdir, seed, options = job
+    options = dict(options)
+    precision = options.pop('precision','float64')
+    name = os.path.splitext(os.path.basename(filename))[0]
+    output = os.path.join(outdir,'%s-k%d.csv' % (name,k))
+    summary = {'file': filename, 'k': k, 'output': output}
+    start = time.perf_counter()
+    try:
+        key = (os.path.abspath(filename), precision)
+        if not key in _BATCH_DATA:
+            header, data = load_dataset(filename)
+            assert len(data) > 0, repr(filename)+' has no points'
+            # The jobs come file by file, so only the last file is worth keeping
+            _BATCH_DATA.clear()
+            _BATCH_DATA[key] = (header, data, _make_dataset(header, data, precision))
+        header, data, dset = _BATCH_DATA[key]
+        assert k <= dset.getSize(), '%d clusters is more than the %d points' % (k,dset.getSize())
+        
+        random.seed(seed)
+        km = _cluster(dset, k, processes=1, **options)
+        import introcs
+        introcs.write_csv(_table(header, km, data), output)
+        summary.update(points=dset.getSize(), inertia=km.getInertia(),
+                       steps=len(km.getHistory()))
+    except Exception as e:
+        summary['error'] = str(e) or e.__class__.__name__
+        summary['output'] = None
+    summary['seconds'] = time.perf_counter()-start
+    return summary